@@ -0,0 +1,86 @@
+# Benchmarks the shortest path searches in routing.py on generated road
+# graphs of 10^3 to 10^5 nodes
+# Run from the project folder: python benchmarks/routingBenchmark.py
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import astar, bidirectionalDijsktra, dijsktra, distanceTuple
+
+
+def gridGraph(nodeCount, seed=0, spacing=100, dropRate=0.1):
+    # Build a city-like grid of roughly nodeCount intersections. Some streets
+    # are removed and every edge is a bit longer than the straight line so
+    # the graph is not perfectly regular
+    rng = random.Random(seed)
+    side = max(2, round(nodeCount ** 0.5))
+    graph = {}
+    for row in range(side):
+        for col in range(side):
+            graph[(col * spacing, row * spacing)] = {}
+    for row in range(side):
+        for col in range(side):
+            node = (col * spacing, row * spacing)
+            for neighbor in ((node[0] + spacing, node[1]),
+                             (node[0], node[1] + spacing)):
+                if neighbor not in graph or rng.random() < dropRate:
+                    continue
+                weight = distanceTuple(node, neighbor) * rng.uniform(1, 1.5)
+                graph[node][neighbor] = weight
+                graph[neighbor][node] = weight
+    return graph
+
+
+def pathLength(graph, path):
+    # Total weight of the edges along a path
+    return sum(graph[path[i]][path[i + 1]] for i in range(len(path) - 1))
+
+
+def benchmark(nodeCount, queries, seed=0):
+    # Time every search on the same random queries and check that they all
+    # find paths of the same length
+    graph = gridGraph(nodeCount, seed)
+    rng = random.Random(seed)
+    nodes = list(graph)
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(queries)]
+    results = {}
+    lengths = {}
+    for name, search in (('dijsktra', dijsktra), ('astar', astar),
+                         ('bidirectional', bidirectionalDijsktra)):
+        start = time.perf_counter()
+        paths = [search(graph, src, dest) for src, dest in pairs]
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed / queries * 1000
+        lengths[name] = [None if path is None else pathLength(graph, path)
+                         for path in paths]
+    for name in lengths:
+        for expected, actual in zip(lengths['dijsktra'], lengths[name]):
+            if (expected is None) != (actual is None) or (
+                    expected is not None and abs(expected - actual) > 1e-6):
+                raise AssertionError(f'{name} found a different path length')
+    return len(graph), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'dijsktra ms':>12} {'astar ms':>10} "
+          f"{'bidirectional ms':>17}")
+    for size in args.sizes:
+        nodeCount, results = benchmark(size, args.queries, args.seed)
+        print(f"{nodeCount:>8} {results['dijsktra']:>12.2f} "
+              f"{results['astar']:>10.2f} {results['bidirectional']:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
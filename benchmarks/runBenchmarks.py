@@ -0,0 +1,268 @@
+# Benchmark suite for routing, collision and frame construction. Runs on the
+# shipped map and on generated city maps of increasing size and writes the
+# results as JSON so runs from different commits can be compared
+# Run from the project folder: python benchmarks/runBenchmarks.py
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+projectFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, projectFolder)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from citygen import generateCity
+from dispatch import DispatchPlanner, DistanceMatrix, Order
+from fleet import Fleet, np
+from mapfile import defaultMapPath, loadMap, parseMap
+from routing import RoutingTable, dijsktra
+from simulation import (Simulation, fastestPathFromGraph, moveHeldKeys,
+                        planShopLeg, startNewDelivery)
+from spatial import buildRoadGraph
+
+
+def timeCalls(function, calls, repeat=5):
+    # Median time of one call in microseconds over several rounds
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        rounds.append((time.perf_counter() - start) / calls * 1e6)
+    return statistics.median(rounds)
+
+
+def makeApp(blocks):
+    # A headless game on the shipped map, or on a generated city of
+    # blocks x blocks blocks
+    if not blocks:
+        return Simulation(seed=0)
+    return Simulation(seed=0, mapData=generateCity(blocks, blocks, blocks))
+
+
+def benchmarkMap(app, mapName, calls, game, drawCounts):
+    # Run every benchmark on one map and return the result records
+    rng = random.Random(0)
+    nodes = list(app.graph)
+    results = []
+
+    def record(name, microseconds, **extra):
+        results.append({'benchmark': name, 'map': mapName,
+                        'nodes': len(app.graph), 'roads': len(app.roads),
+                        'microseconds': round(microseconds, 3), **extra})
+
+    pairs = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(calls)]
+    pairIter = iter(pairs * 5)
+    record('dijsktra', timeCalls(lambda: dijsktra(app.graph, *next(pairIter)),
+                                 calls))
+
+    def plan():
+        app.currentShop = rng.choice(app.shops)
+        app.currentHouse = rng.choice(app.houses)
+        fastestPathFromGraph(app)
+    cache = app.routeCache
+    cache.reset(app.graph, app.routingTable, app.roadsVersion)
+    record('fastestPathFromGraph', timeCalls(plan, calls),
+           routeCacheHitRate=round(cache.stats()['hitRate'], 3))
+
+    def planUncached():
+        cache.reset(app.graph, app.routingTable, app.roadsVersion)
+        plan()
+    record('fastestPathColdCache', timeCalls(planUncached, calls))
+
+    # Maps with more than app.routingTableNodes nodes get no routing table
+    # and search every route instead. Time that fallback on every map, and
+    # what the table it replaces costs to build on the smaller ones
+    table = app.routingTable
+    app.routingTable = None
+    record('fastestPathWithoutTable', timeCalls(planUncached, calls))
+    app.routingTable = table
+    cache.reset(app.graph, app.routingTable, app.roadsVersion)
+    if len(app.graph) <= 2000:
+        record('RoutingTable', timeCalls(lambda: RoutingTable(app.graph), 1,
+                                         repeat=1))
+
+    def planShop():
+        app.currentShop = rng.choice(app.shops)
+        planShopLeg(app)
+    record('planShopLeg', timeCalls(planShop, calls))
+
+    def move():
+        # Walk the player back and forth along the first road
+        app.player1.move(app, rng.choice((-25, 25)), 0)
+    record('Player.move', timeCalls(move, calls * 10))
+
+    def holdKeys():
+        # One onKeyHold call with an arrow key held down
+        moveHeldKeys(app, [rng.choice(('left', 'right'))])
+    record('moveHeldKeys', timeCalls(holdKeys, calls * 10))
+
+    points = [(rng.uniform(0, app.mapWidth), rng.uniform(0, app.mapHeight))
+              for _ in range(calls * 10)]
+    pointIter = iter(points * 5)
+    record('Player.isInRoadRegion', timeCalls(
+        lambda: app.player1.isInRoadRegion(app, *next(pointIter)), calls * 10))
+
+    places = app.houses + app.shops
+    record('House.nearestRoadToHouse', timeCalls(
+        lambda: rng.choice(places).nearestRoadToHouse(app), calls))
+
+    def newDelivery():
+        shop, house = startNewDelivery(app, app.currentShop, app.currentHouse)
+        shop.request = house.request = False
+    record('startNewDelivery', timeCalls(newDelivery, calls))
+
+    # Replan a tour of 20 waiting orders with a generous budget, so the
+    # time is what the heuristic needs rather than the budget
+    orders = [Order(rng.choice(app.shops), rng.choice(app.houses), 0)
+              for _ in range(20)]
+    planner = DispatchPlanner(DistanceMatrix(app), budget=1)
+    start = (app.player2.px, app.player2.py)
+    record('DispatchPlanner.plan', timeCalls(
+        lambda: planner.plan(start, [], orders), calls), orders=20)
+
+    if np is not None:
+        fleet = Fleet(app, 1000, seed=0)
+        record('Fleet.step', timeCalls(fleet.step, calls), couriers=1000)
+
+    if game is not None:
+        game.setupView(app)
+        app.showMiniMap = True
+        app.showProfiler = False
+        app.instructionTab = 1
+        # The first frame renders the visible tiles and the minimap bitmap
+        game.redrawAll(app)
+        drawCounts.clear()
+        drawCounter = game.drawCounter
+        drawCounter.overBudget.clear()
+        game.redrawAll(app)
+        counts = dict(drawCounts)
+        frame = drawCounter.lastFrame
+        budget = drawCounter.budgets.get(frame['screen'])
+        microseconds = timeCalls(lambda: game.redrawAll(app), calls)
+        record('redrawAll', microseconds, drawCalls=sum(counts.values()),
+               drawCallsByType=counts, drawCallsByOrigin=frame['byOrigin'],
+               drawBudget=budget,
+               framesOverBudget=sum(drawCounter.overBudget.values()))
+    return results
+
+
+def benchmarkMapLoading(calls):
+    # Time reading the shipped map from JSON and from its binary cache
+    loadMap(defaultMapPath)  # Make sure the cache is up to date
+    results = []
+    for name, load in (('parseMap', lambda: parseMap(defaultMapPath)),
+                       ('loadMap', lambda: loadMap(defaultMapPath))):
+        results.append({'benchmark': name, 'map': 'shipped',
+                        'microseconds': round(timeCalls(load, calls), 3)})
+    return results
+
+
+def benchmarkMapBuilding(blocks):
+    # Time deriving the road graph from the roads, and building the whole
+    # map, on a generated city of blocks x blocks blocks; 316 gives about
+    # 100k intersections
+    mapData = generateCity(blocks, blocks, blocks)
+    mapName = f'city{blocks}'
+    start = time.perf_counter()
+    app = Simulation(seed=0, mapData=mapData)
+    build = (time.perf_counter() - start) * 1e6
+    graph = timeCalls(lambda: buildRoadGraph(app.roads, app.roadWidth / 2),
+                      1, repeat=3)
+    return [{'benchmark': name, 'map': mapName, 'nodes': len(app.graph),
+             'roads': len(app.roads), 'microseconds': round(microseconds, 3)}
+            for name, microseconds in (('buildRoadGraph', graph),
+                                       ('buildMap', build))]
+
+
+def gitCommit():
+    # Commit the benchmarks ran on, if the project is a git checkout
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=projectFolder, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    # Print how much slower or faster each benchmark got
+    old = {(r['benchmark'], r['map']): r['microseconds']
+           for r in previous['results']}
+    print(f"\nCompared with {previous.get('commit')}:")
+    for result in current['results']:
+        before = old.get((result['benchmark'], result['map']))
+        if before:
+            ratio = result['microseconds'] / before
+            print(f"{result['benchmark']:>26} {result['map']:>10} "
+                  f"{ratio:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, nargs='+', default=[10, 30, 100],
+                        help='sizes of the generated city maps; 316 '
+                             'gives about 100k intersections')
+    parser.add_argument('--build-blocks', type=int, default=316,
+                        help='size of the generated city the road graph '
+                             'and map build are timed on; 0 skips them')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='earlier JSON results to compare')
+    parser.add_argument('--no-draw', action='store_true',
+                        help='skip redrawAll, which needs pillow and pygame')
+    parser.add_argument('--check-budgets', action='store_true',
+                        help='exit with an error if a frame makes more draw '
+                             'calls than its screen budget')
+    args = parser.parse_args()
+    os.chdir(projectFolder)
+
+    game = None
+    drawCounts = None
+    if not args.no_draw:
+        from stubGraphics import installStubGraphics
+        drawCounts = installStubGraphics()
+        import FinalGame as game
+
+    results = benchmarkMapLoading(args.calls)
+    if args.build_blocks:
+        results += benchmarkMapBuilding(args.build_blocks)
+    for blocks in [0] + args.blocks:
+        mapName = f'city{blocks}' if blocks else 'shipped'
+        results += benchmarkMap(makeApp(blocks), mapName, args.calls,
+                                game, drawCounts)
+
+    report = {'commit': gitCommit(), 'python': platform.python_version(),
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        extra = f"  {result['drawCalls']} draw calls" \
+            if 'drawCalls' in result else ''
+        if 'routeCacheHitRate' in result:
+            extra = f"  {result['routeCacheHitRate']:.0%} route cache hits"
+        nodes = f"{result['nodes']:>6} nodes" if 'nodes' in result else ' ' * 12
+        print(f"{result['benchmark']:>26} {result['map']:>10} "
+              f"{nodes} {result['microseconds']:>12.1f} us{extra}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    if args.check_budgets:
+        # Every timed frame counts, not just the first one
+        overBudget = [result for result in results
+                      if result.get('framesOverBudget')]
+        for result in overBudget:
+            print(f"{result['map']}: {result['framesOverBudget']} frames "
+                  f"over the budget of {result['drawBudget']} draw calls")
+        if overBudget:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
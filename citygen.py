@@ -0,0 +1,142 @@
+# Seeded generator for grid-like city maps, used to test how the game scales
+# beyond the hand-drawn map. The maps it returns have the same layout as the
+# ones mapfile.loadMap reads, so buildMap turns them into roads, houses,
+# shops and a derived road graph
+# Run from the project folder to save a map:
+#     python citygen.py maps/city.json --columns 100 --rows 100 --seed 1
+
+import argparse
+import random
+
+from mapfile import writeMap
+
+
+def findRoot(parents, node):
+    # Union-find root of a node, halving the path on the way up
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
+
+def generateCity(seed=0, columns=10, rows=10, spacing=400, roadWidth=75,
+                 density=0.85, houses=30, shops=20):
+    # A city of columns x rows blocks. Street gaps vary around spacing, and
+    # about density of the street segments between two intersections are
+    # kept. The border streets are always kept and dropped segments are put
+    # back where needed so every intersection stays reachable
+    rng = random.Random(seed)
+    half = roadWidth / 2
+    xs = [half]
+    for _ in range(columns):
+        xs.append(xs[-1] + spacing * rng.uniform(0.75, 1.25))
+    ys = [half]
+    for _ in range(rows):
+        ys.append(ys[-1] + spacing * rng.uniform(0.75, 1.25))
+    nodes = [(x, y) for y in ys for x in xs]
+    width = len(xs)
+
+    # Every street segment joins two neighbouring intersections
+    segments = []
+    for j in range(len(ys)):
+        for i in range(columns):
+            segments.append((j * width + i, j * width + i + 1,
+                             j in (0, rows)))
+    for i in range(len(xs)):
+        for j in range(rows):
+            segments.append((j * width + i, (j + 1) * width + i,
+                             i in (0, columns)))
+
+    kept = set()
+    dropped = []
+    parents = list(range(len(nodes)))
+    for a, b, border in segments:
+        if border or rng.random() < density:
+            kept.add((a, b))
+            parents[findRoot(parents, a)] = findRoot(parents, b)
+        else:
+            dropped.append((a, b))
+    rng.shuffle(dropped)
+    for a, b in dropped:
+        rootA, rootB = findRoot(parents, a), findRoot(parents, b)
+        if rootA != rootB:
+            kept.add((a, b))
+            parents[rootA] = rootB
+
+    # Join the kept segments of each street into roads as long as possible
+    roads = []
+    lines = [[j * width + i for i in range(len(xs))] for j in range(len(ys))]
+    lines += [[j * width + i for j in range(len(ys))] for i in range(len(xs))]
+    for line in lines:
+        start = None
+        for a, b in zip(line, line[1:]):
+            if (a, b) in kept:
+                if start is None:
+                    start = a
+            elif start is not None:
+                roads.append((start, a))
+                start = None
+        if start is not None:
+            roads.append((start, line[-1]))
+
+    # Houses and shops sit beside a road, away from its intersections so the
+    # road they face is the nearest one. Along the border streets they only
+    # go on the inner side, which keeps them on the map
+    places = set()
+    offset = half + 60
+    keptSegments = sorted(kept)
+    while len(places) < houses + shops:
+        a, b = rng.choice(keptSegments)
+        (ax, ay), (bx, by) = nodes[a], nodes[b]
+        along = rng.uniform(0.3, 0.7)
+        side = rng.choice((-1, 1))
+        if ay == by:
+            if ay == ys[0]:
+                side = 1
+            elif ay == ys[-1]:
+                side = -1
+            place = (round(ax + (bx - ax) * along), round(ay + side * offset))
+        else:
+            if ax == xs[0]:
+                side = 1
+            elif ax == xs[-1]:
+                side = -1
+            place = (round(ax + side * offset), round(ay + (by - ay) * along))
+        places.add(place)
+    places = sorted(places)
+    rng.shuffle(places)
+
+    return {
+        'width': xs[-1] + half,
+        'height': ys[-1] + half,
+        'roadWidth': roadWidth,
+        'backgrounds': [],
+        'nodes': nodes,
+        'roads': roads,
+        'links': None,
+        'houses': places[:houses],
+        'shops': places[houses:],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='JSON map file to write')
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--spacing', type=float, default=400)
+    parser.add_argument('--density', type=float, default=0.85)
+    parser.add_argument('--houses', type=int, default=30)
+    parser.add_argument('--shops', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    mapData = generateCity(args.seed, args.columns, args.rows, args.spacing,
+                           density=args.density, houses=args.houses,
+                           shops=args.shops)
+    writeMap(args.path, mapData)
+    print(f"{len(mapData['nodes'])} intersections, "
+          f"{len(mapData['roads'])} roads written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Point-on-road tests. GridCollision answers one point at a time from the
+# road grid; ArrayCollision also keeps every road rectangle, including the
+# skewLeft corner extension, in NumPy arrays so that many points can be
+# tested in one vectorized call. Both have the same interface, so the
+# players use whichever one updateRoads picked without knowing which it is
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from spatial import buildRoadGrid
+
+
+class GridCollision:
+    def __init__(self, roads, cellSize):
+        self.roads = roads
+        self.grid = buildRoadGrid(roads, cellSize)
+
+    def containsPoint(self, px, py):
+        # Whether the point (px, py) is on any road
+        for road in self.grid.query(px, py):
+            if road.isPlayerInRegion(px, py):
+                return True
+        return False
+
+    def containsPoints(self, xs, ys):
+        # Which of the points (xs[i], ys[i]) are on a road
+        return [self.containsPoint(x, y) for x, y in zip(xs, ys)]
+
+
+class ArrayCollision(GridCollision):
+    # Single points still go through the road grid, which is faster than
+    # NumPy for one point; batches use a dense table of the roads in every
+    # grid cell, padded with a rectangle that contains nothing
+
+    def __init__(self, roads, cellSize):
+        super().__init__(roads, cellSize)
+        bounds = [road.bounds() for road in roads]
+        # The extra last rectangle is the padding, so index -1 points at it
+        inf = float('inf')
+        bounds.append((inf, inf, -inf, -inf))
+        self.left, self.top, self.right, self.bottom = \
+            np.array(bounds, dtype=float).T.copy()
+
+        cells = self.grid.cells
+        self.cellSize = cellSize
+        if not cells:
+            self.col0 = self.row0 = 0
+            self.cols = self.rows = 1
+            self.table = np.full((1, 1), -1, dtype=np.int32)
+            return
+        self.col0 = min(col for col, row in cells)
+        self.row0 = min(row for col, row in cells)
+        self.cols = max(col for col, row in cells) - self.col0 + 1
+        self.rows = max(row for col, row in cells) - self.row0 + 1
+        index = {id(road): i for i, road in enumerate(roads)}
+        depth = max(len(cellRoads) for cellRoads in cells.values())
+        self.table = np.full((self.cols * self.rows, depth), -1,
+                             dtype=np.int32)
+        for (col, row), cellRoads in cells.items():
+            cell = (row - self.row0) * self.cols + (col - self.col0)
+            self.table[cell, :len(cellRoads)] = [index[id(road)]
+                                                 for road in cellRoads]
+
+    def containsPoints(self, xs, ys):
+        # Which of the points (xs[i], ys[i]) are on a road, as a bool array
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        cols = np.floor(xs / self.cellSize).astype(np.int64) - self.col0
+        rows = np.floor(ys / self.cellSize).astype(np.int64) - self.row0
+        inside = (cols >= 0) & (cols < self.cols) & \
+            (rows >= 0) & (rows < self.rows)
+        cells = np.where(inside, rows * self.cols + cols, 0)
+        # Candidate roads of every point, one row per point
+        candidates = self.table[cells]
+        px = xs[:, None]
+        py = ys[:, None]
+        hits = ((self.left[candidates] <= px) & (px <= self.right[candidates])
+                & (self.top[candidates] <= py)
+                & (py <= self.bottom[candidates]))
+        return hits.any(axis=1) & inside
+
+
+def buildCollision(roads, cellSize, backend='auto'):
+    # The collision backend for a set of roads: 'numpy', 'python', or
+    # 'auto' for NumPy whenever it is installed
+    if backend == 'numpy' or (backend == 'auto' and np is not None):
+        if np is None:
+            raise ImportError('the numpy collision backend needs numpy')
+        return ArrayCollision(roads, cellSize)
+    return GridCollision(roads, cellSize)
@@ -0,0 +1,367 @@
+# Dispatch mode: orders queue up faster than one courier can serve them one
+# at a time, and the computer plans a tour of several pickups and drop-offs.
+# Road distances between shops and houses come from a distance matrix that
+# is filled in row by row, as orders arrive, and reused by every replan. Each
+# replan searches the rows of new orders, builds the tour by cheapest
+# insertion, then improves it by moving orders, all within its latency
+# budget
+# Run from the project folder: python dispatch.py --ticks 5000 --blocks 10
+
+import argparse
+import time
+
+from routing import inf, settleNodes
+from simulation import Simulation, attachPointsToGraph, fastestPath
+
+
+class Order:
+    def __init__(self, shop, house, tick):
+        self.shop = shop
+        self.house = house
+        self.created = tick  # Tick the order was placed on
+
+
+class DistanceMatrix:
+    # Road distances between the delivery points of all shops and houses.
+    # A row holds the distances from one delivery point to every node; it
+    # is searched the first time it is needed and kept until the roads
+    # change. fill can spread the searches over several calls
+
+    def __init__(self, app):
+        self.app = app
+        self.clear()
+
+    def clear(self):
+        app = self.app
+        self.roadsVersion = app.roadsVersion
+        self.points = set(place.destinationPoint(app)
+                          for place in app.shops + app.houses)
+        # The delivery points of every place, attached to the road graph
+        self.overlay = attachPointsToGraph(app, list(self.points))
+        self.nodes = set(app.graph) | self.points
+        self.rows = {}
+        # Searches cut short by a deadline, as {point: (search, partial
+        # row)}, resumed by the next fill
+        self.searches = {}
+
+    def row(self, a):
+        # Road distances from a delivery point to every node and delivery
+        # point it can reach
+        self.fill([a])
+        return self.rows[a]
+
+    def fill(self, points, deadline=inf):
+        # Search the rows of some delivery points, stopping at the deadline,
+        # and return whether every one of them is complete
+        if self.roadsVersion != self.app.roadsVersion:
+            self.clear()
+        for point in points:
+            if point in self.rows:
+                continue
+            search = self.searches.get(point)
+            if search is None:
+                search = self.searches[point] = (
+                    settleNodes(self.overlay, point, self.nodes), {})
+            steps, row = search
+            for node, distance in steps:
+                row[node] = distance
+                # Check the clock every few nodes rather than every one
+                if len(row) % 16 == 0 and time.perf_counter() > deadline:
+                    return False
+            self.rows[point] = row
+            del self.searches[point]
+        return True
+
+    def fromPoint(self, src, targets):
+        # Road distances from any point, such as the courier's position, to
+        # some of the delivery points. The roads run both ways, so they are
+        # read from the targets' rows through the ends of src's road
+        links = attachPointsToGraph(self.app, [src]).added.get(src, {})
+        found = {}
+        for target in targets:
+            row = self.row(target)
+            best = row.get(src, inf)
+            for node, weight in links.items():
+                best = min(best, weight + row.get(node, inf))
+            if best < inf:
+                found[target] = best
+        return found
+
+
+class DispatchPlanner:
+    # Plans the order of the stops of one courier. A stop is a pair
+    # (order, isPickup); an order's pickup always comes before its drop-off
+
+    def __init__(self, matrix, budget=0.005):
+        self.matrix = matrix
+        self.budget = budget  # Seconds one replan may take
+        # Whether the last plan had the distances of every order, and the
+        # orders it left out because they cannot be reached
+        self.complete = True
+        self.unreachable = []
+
+    def plan(self, start, carried, waiting):
+        # Tour that starts at the courier's position, drops off every carried
+        # order and picks up and drops off the waiting orders. Orders that
+        # cannot be reached are left out and listed in unreachable, and
+        # orders whose distances could not be searched within the budget are
+        # left out too, setting complete to False so the caller can replan
+        # once the searches finish
+        deadline = time.perf_counter() + self.budget
+        # Leave a tenth of the budget for building the tour
+        searchDeadline = deadline - self.budget / 10
+        matrix = self.matrix
+        app = matrix.app
+        points = {}
+        for order in carried + waiting:
+            shop = order.shop.destinationPoint(app)
+            house = order.house.destinationPoint(app)
+            if not matrix.fill([shop, house], searchDeadline):
+                self.complete = False
+                break
+            points[order, True] = shop
+            points[order, False] = house
+        else:
+            self.complete = True
+        carried = [order for order in carried if (order, False) in points]
+        waiting = [order for order in waiting if (order, True) in points]
+        # Look the rows up once, so a distance is two dictionary reads
+        rows = {stop: matrix.rows[point] for stop, point in points.items()}
+        fromStart = matrix.fromPoint(start, set(points.values()))
+
+        def distance(a, b):
+            # Distance between two stops, where None is the start
+            if a is None:
+                return fromStart.get(points[b], inf)
+            return rows[a].get(points[b], inf)
+
+        # Out of time, the remaining stops are served one after the other
+        # at the end of the tour
+        tour = []
+        self.unreachable = []
+        for order in carried + waiting:
+            pickup = (order, True) if order in waiting else None
+            dropoff = (order, False)
+            stops = [dropoff] if pickup is None else [pickup, dropoff]
+            if time.perf_counter() < deadline:
+                placed = insertOrder(tour, distance, pickup, dropoff,
+                                     deadline)
+            elif tourLength(stops, distance,
+                            tour[-1] if tour else None) < inf:
+                placed = tour + stops
+            else:
+                placed = None
+            if placed is None:
+                self.unreachable.append(order)
+            else:
+                tour = placed
+
+        # Move one order at a time to its cheapest place in the rest of the
+        # tour until no move helps or the budget runs out
+        length = tourLength(tour, distance)
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for order in carried + waiting:
+                if time.perf_counter() > deadline:
+                    break
+                stops = [stop for stop in tour if stop[0] is order]
+                if not stops:
+                    continue
+                rest = [stop for stop in tour if stop[0] is not order]
+                pickup = (order, True) if len(stops) == 2 else None
+                moved = insertOrder(rest, distance, pickup, (order, False),
+                                    deadline)
+                if moved is None:
+                    continue
+                movedLength = tourLength(moved, distance)
+                if movedLength < length - 1e-9:
+                    tour, length = moved, movedLength
+                    improved = True
+        return tour
+
+
+def addedDistance(stops, distance, i, stop):
+    # Extra distance of putting stop right after stops[i]
+    if i + 1 < len(stops):
+        return (distance(stops[i], stop) + distance(stop, stops[i + 1]) -
+                distance(stops[i], stops[i + 1]))
+    return distance(stops[i], stop)
+
+
+def insertOrder(tour, distance, pickup, dropoff, deadline=inf):
+    # A copy of the tour with an order's stops where they add the least
+    # distance, the pickup (if any) before the drop-off, or None if they
+    # cannot be reached. Past the deadline it settles for the best place
+    # found so far. The start is stops[0], so stops is one ahead of tour
+    stops = [None] + tour
+    best = inf
+    bestStops = None
+    if pickup is None:
+        for j in range(len(stops)):
+            cost = addedDistance(stops, distance, j, dropoff)
+            if cost < best:
+                best = cost
+                bestStops = stops[:j + 1] + [dropoff] + stops[j + 1:]
+    else:
+        for i in range(len(stops)):
+            if bestStops is not None and time.perf_counter() > deadline:
+                break
+            pickupCost = addedDistance(stops, distance, i, pickup)
+            if pickupCost >= best:
+                continue
+            withPickup = stops[:i + 1] + [pickup] + stops[i + 1:]
+            for j in range(i + 1, len(withPickup)):
+                cost = pickupCost + addedDistance(withPickup, distance, j,
+                                                  dropoff)
+                if cost < best:
+                    best = cost
+                    bestStops = (withPickup[:j + 1] + [dropoff] +
+                                 withPickup[j + 1:])
+    if bestStops is None:
+        return None
+    return bestStops[1:]
+
+
+def tourLength(tour, distance, previous=None):
+    # Total distance of a tour from the courier's position, or from the
+    # stop previous
+    total = 0
+    for stop in tour:
+        total += distance(previous, stop)
+        previous = stop
+    return total
+
+
+class Dispatcher:
+    # Runs dispatch mode for the computer courier, app.player2: a new order
+    # arrives every orderInterval ticks, every new order triggers a replan,
+    # and the computer drives from stop to stop along the road graph
+
+    def __init__(self, app, orderInterval=60, maxWaiting=20, budget=0.005):
+        self.app = app
+        self.matrix = DistanceMatrix(app)
+        self.planner = DispatchPlanner(self.matrix, budget)
+        self.orderInterval = orderInterval
+        self.maxWaiting = maxWaiting
+        self.waiting = []  # Orders not picked up yet
+        self.carried = []  # Orders picked up but not delivered
+        self.tour = []
+        self.path = None  # Route to the next stop of the tour
+        self.cursor = 0
+        self.ticks = 0
+        self.delivered = 0
+        self.dropped = 0  # Orders the computer cannot reach
+        self.planTimes = []
+
+    def placeOrder(self):
+        app = self.app
+        order = Order(app.rng.choice(app.shops), app.rng.choice(app.houses),
+                      self.ticks)
+        self.waiting.append(order)
+        self.replan()
+
+    def replan(self):
+        start = (self.app.player2.px, self.app.player2.py)
+        began = time.perf_counter()
+        self.tour = self.planner.plan(start, self.carried, self.waiting)
+        self.planTimes.append(time.perf_counter() - began)
+        for order in self.planner.unreachable:
+            self.dropOrder(order)
+        self.headToNextStop()
+
+    def dropOrder(self, order):
+        # Give up on a waiting order the computer cannot reach. A carried
+        # order stays carried, since it can only end at its house
+        if order in self.waiting:
+            self.waiting.remove(order)
+            self.dropped += 1
+
+    def headToNextStop(self):
+        # Route the computer to the first stop of the tour
+        app = self.app
+        self.path = None
+        while self.tour and self.path is None:
+            order, isPickup = self.tour[0]
+            place = order.shop if isPickup else order.house
+            start = (app.player2.px, app.player2.py)
+            point = place.destinationPoint(app)
+            overlay = attachPointsToGraph(app, [start, point])
+            self.path = fastestPath(app, overlay, start, point)
+            if self.path is None:
+                # Unreachable from here. The drop-off of an order goes
+                # with its pickup
+                self.tour = [stop for stop in self.tour
+                             if stop[0] is not order]
+                self.dropOrder(order)
+        self.cursor = 1
+
+    def reachStop(self):
+        order, isPickup = self.tour.pop(0)
+        if isPickup:
+            self.waiting.remove(order)
+            self.carried.append(order)
+        else:
+            self.carried.remove(order)
+            self.delivered += 1
+            self.app.player2Score += 1
+        self.headToNextStop()
+
+    def step(self):
+        # Advance dispatch mode by one tick
+        app = self.app
+        self.ticks += 1
+        if (self.ticks % self.orderInterval == 0 and
+                len(self.waiting) < self.maxWaiting):
+            self.placeOrder()
+        elif not self.planner.complete:
+            # Carry on with the searches the last replan ran out of time
+            # for, and add their orders to the tour
+            self.replan()
+        if self.path is None:
+            return
+        if self.cursor >= len(self.path):
+            self.reachStop()
+            return
+        end = self.path[self.cursor]
+        app.player2.moveStep(app, (app.player2.px, app.player2.py), end)
+        if (app.player2.px, app.player2.py) == tuple(end):
+            self.cursor += 1
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.step()
+        return self.delivered
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=5000)
+    parser.add_argument('--interval', type=int, default=60,
+                        help='ticks between two new orders')
+    parser.add_argument('--budget', type=float, default=5,
+                        help='milliseconds per replan; 0 serves the orders '
+                             'one at a time in arrival order')
+    parser.add_argument('--blocks', type=int, default=0,
+                        help='size of a generated city, 0 for the shipped map')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.blocks:
+        from citygen import generateCity
+        app = Simulation(seed=args.seed, mapData=generateCity(
+            args.seed, args.blocks, args.blocks))
+    else:
+        app = Simulation(seed=args.seed)
+    dispatcher = Dispatcher(app, args.interval, budget=args.budget / 1000)
+    delivered = dispatcher.run(args.ticks)
+    times = sorted(dispatcher.planTimes)
+    print(f"{delivered} deliveries in {args.ticks} ticks, "
+          f"{len(dispatcher.waiting) + len(dispatcher.carried)} orders open, "
+          f"{dispatcher.dropped} unreachable, "
+          f"{len(times)} replans, median {times[len(times) // 2] * 1000:.2f} "
+          f"ms, max {times[-1] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
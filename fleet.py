@@ -0,0 +1,158 @@
+# Fleet mode for load tests: many computer couriers on one map, stored in
+# NumPy arrays and advanced together once per tick. Each courier moves like
+# the Computer in simulation.py, one step along x and then one along y
+# towards the next point of its route, and starts a new random delivery
+# whenever it finishes one. Needs numpy, which the game itself does not
+# Run from the project folder: python fleet.py --couriers 1000 --blocks 30
+
+import argparse
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from simulation import Simulation, attachPointsToGraph, fastestPath
+
+
+class Fleet:
+    def __init__(self, app, size, seed=None):
+        if np is None:
+            raise ImportError('fleet mode needs numpy: pip install numpy')
+        self.app = app
+        self.size = size
+        self.rng = random.Random(seed)
+        self.radius = app.playerRadius / 2  # Same size as the Computer
+
+        # Every courier starts on a random graph node
+        nodes = list(app.graph)
+        starts = [self.rng.choice(nodes) for _ in range(size)]
+        self.px = np.array([x for x, y in starts], dtype=float)
+        self.py = np.array([y for x, y in starts], dtype=float)
+        self.targetX = self.px.copy()
+        self.targetY = self.py.copy()
+        # Route of each courier, the index of the point it is heading to
+        # and the index of its shop's point on the route
+        self.routes = [None] * size
+        self.cursor = np.zeros(size, dtype=int)
+        self.pickupIndex = np.zeros(size, dtype=int)
+        self.picked = np.zeros(size, dtype=bool)
+        self.delivered = np.zeros(size, dtype=int)
+        self.ticks = 0
+        for courier in range(size):
+            self.startDelivery(courier)
+
+    def startDelivery(self, courier):
+        # Give a courier a random shop and house and plan its whole route.
+        # Couriers that cannot reach them stay put and try again next tick
+        app = self.app
+        shop = self.rng.choice(app.shops)
+        house = self.rng.choice(app.houses)
+        src = (float(self.px[courier]), float(self.py[courier]))
+        shopPoint = shop.destinationPoint(app)
+        housePoint = house.destinationPoint(app)
+        overlay = attachPointsToGraph(app, [src, shopPoint, housePoint])
+        toShop = fastestPath(app, overlay, src, shopPoint)
+        toHouse = fastestPath(app, overlay, shopPoint, housePoint)
+        self.picked[courier] = False
+        if toShop is None or toHouse is None:
+            self.routes[courier] = [src]
+            self.cursor[courier] = 0
+            self.pickupIndex[courier] = 0
+        else:
+            self.routes[courier] = toShop + toHouse[1:]
+            self.cursor[courier] = 1 if len(toShop) > 1 else 0
+            self.pickupIndex[courier] = len(toShop) - 1
+        self.setTarget(courier)
+
+    def setTarget(self, courier):
+        x, y = self.routes[courier][self.cursor[courier]]
+        self.targetX[courier] = x
+        self.targetY[courier] = y
+
+    def onRoad(self, xs, ys):
+        # Which of the points (xs[i], ys[i]) lie on a road, in one batched
+        # call when the map uses the NumPy collision backend
+        return np.asarray(self.app.roadCollision.containsPoints(xs, ys),
+                          dtype=bool)
+
+    def moveAxis(self, position, other, target, step, horizontal):
+        # Move every courier one step along one axis, like Computer.moveStep:
+        # snap onto the target when it is within a step, otherwise take a
+        # full step if the road continues that way
+        delta = target - position
+        snap = np.abs(delta) <= step
+        position[snap] = target[snap]
+        moving = np.flatnonzero(~snap)
+        if len(moving):
+            direction = np.sign(delta[moving])
+            nextPosition = position[moving] + step * direction
+            probe = nextPosition + self.radius * direction
+            if horizontal:
+                free = self.onRoad(probe, other[moving])
+            else:
+                free = self.onRoad(other[moving], probe)
+            position[moving[free]] = nextPosition[free]
+
+    def step(self):
+        # Advance every courier by one tick and return how many deliveries
+        # were completed
+        app = self.app
+        self.ticks += 1
+        self.moveAxis(self.px, self.py, self.targetX, app.dx, True)
+        self.moveAxis(self.py, self.px, self.targetY, app.dy, False)
+
+        # Only couriers that reached their route point need Python work
+        completed = 0
+        arrived = np.flatnonzero((self.px == self.targetX) &
+                                 (self.py == self.targetY))
+        for courier in arrived.tolist():
+            route = self.routes[courier]
+            if self.cursor[courier] >= self.pickupIndex[courier]:
+                self.picked[courier] = True
+            if self.cursor[courier] + 1 < len(route):
+                self.cursor[courier] += 1
+                self.setTarget(courier)
+            else:
+                if len(route) > 1:
+                    self.delivered[courier] += 1
+                    completed += 1
+                self.startDelivery(courier)
+        return completed
+
+    def run(self, ticks):
+        # Step the fleet and return the number of completed deliveries
+        return sum(self.step() for _ in range(ticks))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--couriers', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=300)
+    parser.add_argument('--blocks', type=int, default=0,
+                        help='size of a generated city, 0 for the shipped map')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.blocks:
+        from citygen import generateCity
+        app = Simulation(seed=args.seed, mapData=generateCity(
+            args.seed, args.blocks, args.blocks))
+    else:
+        app = Simulation(seed=args.seed)
+    start = time.perf_counter()
+    fleet = Fleet(app, args.couriers, args.seed)
+    planned = time.perf_counter() - start
+    start = time.perf_counter()
+    deliveries = fleet.run(args.ticks)
+    elapsed = time.perf_counter() - start
+    print(f"{args.couriers} couriers planned in {planned:.2f}s, "
+          f"{args.ticks} ticks in {elapsed:.2f}s "
+          f"({args.couriers * args.ticks / elapsed:.0f} courier ticks/s), "
+          f"{deliveries} deliveries")
+
+
+if __name__ == '__main__':
+    main()
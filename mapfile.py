@@ -0,0 +1,185 @@
+# Loads maps from JSON files. A map file holds the map size, the background
+# images, the road graph nodes, the roads as pairs of node indexes, optional
+# graph links per node, and the house and shop positions. The first load of
+# a file compiles it into a binary cache next to it; later loads map the
+# cache into memory and read its arrays directly instead of parsing JSON
+
+import array
+import json
+import mmap
+import os
+import struct
+
+defaultMapPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'maps', 'default.json')
+
+cacheMagic = b'EXCMAP01'
+# Magic, source size and mtime, width, height, road width, then the number
+# of nodes, links, roads, houses, shops and backgrounds, the byte length of
+# the background names and whether the map has links. The header is a
+# multiple of 8 bytes so every array after it stays aligned
+cacheHeader = struct.Struct('<8sqq3d8I')
+
+
+def parseMap(path):
+    # Read a JSON map file into a map dict
+    with open(path) as f:
+        data = json.load(f)
+    width, height = data['width'], data['height']
+    return {
+        'width': width,
+        'height': height,
+        'roadWidth': data.get('roadWidth', min(width, height) / 20),
+        'backgrounds': [tuple(background)
+                        for background in data.get('backgrounds', [])],
+        'nodes': [tuple(node) for node in data['nodes']],
+        'roads': [tuple(road) for road in data['roads']],
+        'links': data.get('links'),
+        'houses': [tuple(house) for house in data.get('houses', [])],
+        'shops': [tuple(shop) for shop in data.get('shops', [])],
+    }
+
+
+def writeMap(path, mapData):
+    # Save a map dict as a JSON map file, one list entry per line
+    keys = ['width', 'height', 'roadWidth', 'backgrounds', 'nodes', 'roads',
+            'links', 'houses', 'shops']
+    entries = []
+    for key in keys:
+        value = mapData.get(key)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            items = ',\n'.join('    ' + json.dumps(list(item))
+                               for item in value)
+            entries.append(f'  "{key}": [\n{items}\n  ]' if value
+                           else f'  "{key}": []')
+        else:
+            entries.append(f'  "{key}": {json.dumps(value)}')
+    with open(path, 'w') as f:
+        f.write('{\n' + ',\n'.join(entries) + '\n}\n')
+
+
+def cachePathFor(path):
+    return os.path.splitext(path)[0] + '.mapcache'
+
+
+def writeCache(cachePath, mapData, sourceStat):
+    # Store the map as a header followed by flat arrays of doubles and
+    # 64-bit ints. Written to a temporary file first so a half-written
+    # cache is never read
+    # Links are stored as one flat target array and the offset where the
+    # targets of each node start, and left out when the map has none
+    links = mapData['links']
+    linkStarts = array.array('q', [] if links is None else [0])
+    linkTargets = array.array('q')
+    for neighbors in links or []:
+        linkTargets.extend(neighbors)
+        linkStarts.append(len(linkTargets))
+    names = '\n'.join(name for name, x, y in mapData['backgrounds'])
+    names = names.encode('utf-8')
+    sections = [
+        array.array('d', [c for node in mapData['nodes'] for c in node]),
+        linkStarts,
+        linkTargets,
+        array.array('q', [i for road in mapData['roads'] for i in road]),
+        array.array('d', [c for house in mapData['houses'] for c in house]),
+        array.array('d', [c for shop in mapData['shops'] for c in shop]),
+        array.array('d', [c for name, x, y in mapData['backgrounds']
+                          for c in (x, y)]),
+    ]
+    header = cacheHeader.pack(
+        cacheMagic, sourceStat.st_size, sourceStat.st_mtime_ns,
+        mapData['width'], mapData['height'], mapData['roadWidth'],
+        len(mapData['nodes']), len(linkTargets), len(mapData['roads']),
+        len(mapData['houses']), len(mapData['shops']),
+        len(mapData['backgrounds']), len(names), links is not None)
+    tempPath = cachePath + '.tmp'
+    with open(tempPath, 'wb') as f:
+        f.write(header)
+        for section in sections:
+            f.write(section.tobytes())
+        f.write(names)
+    os.replace(tempPath, cachePath)
+
+
+def readCache(cachePath, sourceStat):
+    # Load a map from its binary cache, or return None if there is no cache
+    # or it was compiled from a different version of the source file
+    try:
+        with open(cachePath, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # Missing, unreadable or empty
+    with data:
+        if len(data) < cacheHeader.size:
+            return None
+        (magic, size, mtime, width, height, roadWidth, nodeCount, linkCount,
+         roadCount, houseCount, shopCount, backgroundCount, namesLength,
+         hasLinks) = cacheHeader.unpack_from(data)
+        if (magic != cacheMagic or size != sourceStat.st_size or
+                mtime != sourceStat.st_mtime_ns):
+            return None
+
+        counts = [nodeCount * 2, nodeCount + 1 if hasLinks else 0,
+                  linkCount, roadCount * 2,
+                  houseCount * 2, shopCount * 2, backgroundCount * 2]
+        if len(data) != cacheHeader.size + sum(counts) * 8 + namesLength:
+            return None
+
+        view = memoryview(data)
+        views = [view]
+        offset = cacheHeader.size
+        for kind, count in zip('dqqqddd', counts):
+            # Cast each array in place instead of copying it
+            views.append(view[offset:offset + count * 8].cast(kind))
+            offset += count * 8
+        try:
+            (nodes, linkStarts, linkTargets, roads, houses, shops,
+             positions) = views[1:]
+            names = bytes(view[offset:offset + namesLength]).decode('utf-8')
+
+            def pairs(values):
+                return list(zip(values[0::2].tolist(), values[1::2].tolist()))
+
+            links = None
+            if hasLinks:
+                starts = linkStarts.tolist()
+                targets = linkTargets.tolist()
+                links = [targets[starts[i]:starts[i + 1]]
+                         for i in range(nodeCount)]
+            names = names.split('\n') if backgroundCount else []
+            mapData = {
+                'width': width,
+                'height': height,
+                'roadWidth': roadWidth,
+                'backgrounds': [(name, x, y) for name, (x, y)
+                                in zip(names, pairs(positions))],
+                'nodes': pairs(nodes),
+                'roads': pairs(roads),
+                'links': links,
+                'houses': pairs(houses),
+                'shops': pairs(shops),
+            }
+        finally:
+            # The views must be released before the mapping is closed
+            for values in reversed(views):
+                values.release()
+    return mapData
+
+
+def loadMap(path=defaultMapPath, useCache=True):
+    # Load a map file, through its binary cache when it is up to date
+    sourceStat = os.stat(path)
+    cachePath = cachePathFor(path)
+    if useCache:
+        mapData = readCache(cachePath, sourceStat)
+        if mapData is not None:
+            return mapData
+    mapData = parseMap(path)
+    if useCache:
+        try:
+            writeCache(cachePath, mapData, sourceStat)
+        except OSError:
+            pass  # A read-only map folder just means no cache
+    return mapData
@@ -0,0 +1,157 @@
+import collections
+import contextlib
+import csv
+import functools
+import json
+import math
+import time
+import warnings
+
+
+def percentile(sortedSamples, fraction):
+    # Nearest-rank percentile of an already sorted list of samples
+    if not sortedSamples:
+        return 0
+    rank = max(0, math.ceil(fraction * len(sortedSamples)) - 1)
+    return sortedSamples[rank]
+
+
+class FrameProfiler:
+    # Times the app callbacks on every call. The most recent samples of each
+    # callback are kept in fixed-size ring buffers, so the memory used and the
+    # cost of computing the stats stay the same however long the game runs
+    callbacks = ('onStep', 'onKeyHold', 'onKeyPress', 'redrawAll')
+
+    def __init__(self, size=600):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        # Forget every sample recorded so far
+        self.startTime = time.perf_counter()
+        self.samples = {name: collections.deque(maxlen=self.size)
+                        for name in self.callbacks}
+        # (seconds since start, callback, milliseconds) of recent calls,
+        # in the order they happened
+        self.trace = collections.deque(maxlen=self.size * len(self.callbacks))
+
+    def record(self, name, start, end):
+        # Store one call of a callback that ran from start to end
+        milliseconds = (end - start) * 1000
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = collections.deque(maxlen=self.size)
+        samples.append(milliseconds)
+        self.trace.append((start - self.startTime, name, milliseconds))
+
+    def timed(self, function):
+        # Decorator that records every call of an app callback
+        name = function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, start, time.perf_counter())
+        return wrapper
+
+    def stats(self, name):
+        # p50, p95 and p99 of the recent calls of a callback in milliseconds
+        samples = sorted(self.samples.get(name, ()))
+        return {'calls': len(samples),
+                'p50': percentile(samples, 0.50),
+                'p95': percentile(samples, 0.95),
+                'p99': percentile(samples, 0.99)}
+
+    def exportCsv(self, path):
+        # Write the recent calls as a CSV trace
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['seconds', 'callback', 'milliseconds'])
+            for seconds, name, milliseconds in self.trace:
+                writer.writerow([f'{seconds:.6f}', name,
+                                 f'{milliseconds:.4f}'])
+
+    def exportJson(self, path):
+        # Write the recent calls and the stats of every callback as JSON
+        report = {'stats': {name: self.stats(name) for name in self.samples},
+                  'trace': [{'seconds': seconds, 'callback': name,
+                             'milliseconds': milliseconds}
+                            for seconds, name, milliseconds in self.trace]}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+class DrawCounter:
+    # Counts the draw calls of every frame by type and by the part of the
+    # screen that made them, and counts the frames of each screen that go
+    # over its budget. The first such frame of a screen also warns
+    # The cmu_graphics draw functions the game wraps with counted
+    drawFunctions = ('drawLine', 'drawRect', 'drawImage', 'drawCircle',
+                     'drawLabel')
+
+    def __init__(self, budgets=None, defaultOrigin='other'):
+        # budgets maps a screen name to the most draw calls one frame of
+        # that screen should make
+        self.budgets = dict(budgets or {})
+        self.currentOrigin = defaultOrigin
+        self.byType = collections.Counter()
+        self.byOrigin = collections.Counter()
+        self.lastFrame = {'screen': None, 'total': 0, 'byType': {},
+                          'byOrigin': {}}
+        # Frames over budget so far, by screen
+        self.overBudget = collections.Counter()
+
+    def counted(self, function):
+        # Wrap a draw function so that every call is counted
+        name = function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self.byType[name] += 1
+            self.byOrigin[self.currentOrigin] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    @contextlib.contextmanager
+    def origin(self, name):
+        # Attribute the draw calls made inside the block to name
+        previous = self.currentOrigin
+        self.currentOrigin = name
+        try:
+            yield
+        finally:
+            self.currentOrigin = previous
+
+    def frame(self, function):
+        # Decorator for redrawAll that counts each call as one frame of the
+        # screen the app is on
+        @functools.wraps(function)
+        def wrapper(app, *args, **kwargs):
+            self.byType.clear()
+            self.byOrigin.clear()
+            try:
+                return function(app, *args, **kwargs)
+            finally:
+                self.endFrame(app.currentScreen)
+        return wrapper
+
+    def endFrame(self, screen):
+        # Keep the counts of the finished frame and check them against the
+        # budget of its screen
+        total = sum(self.byType.values())
+        self.lastFrame = {'screen': screen, 'total': total,
+                          'byType': dict(self.byType),
+                          'byOrigin': dict(self.byOrigin)}
+        budget = self.budgets.get(screen)
+        if budget is not None and total > budget:
+            self.overBudget[screen] += 1
+            # Warn once per screen rather than leave it to the warnings
+            # filter, and keep counting the frames after that
+            if self.overBudget[screen] == 1:
+                warnings.warn(f'{screen} screen made {total} draw calls, '
+                              f'over its budget of {budget} per frame; '
+                              f'later frames are counted in overBudget',
+                              RuntimeWarning)
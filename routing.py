@@ -0,0 +1,543 @@
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
+from heapq import heappop, heappush
+from threading import Lock
+from time import perf_counter
+
+
+# Utility function to calculate distance between two points
+def distanceTuple(tuple1, tuple2):
+    x1, y1 = tuple1
+    x2, y2 = tuple2
+    return ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+
+
+# Representation of infinity for unreached nodes
+inf = float('inf')
+
+
+# The dijsktra helper function below is slightly adapted from
+# a youtube tutorial on shortest path algorithms
+# I learned about the algorithm from this tutorial
+# link: https://youtu.be/OrJ004Wid4o
+
+def dijsktra(graph, src, dest):
+    # Best known distance to each reached node; unreached nodes are absent
+    distance = {src: 0}
+    # Single predecessor pointer per node, the path is rebuilt at the end
+    pred = {src: None}
+    # Track visited nodes
+    visited = set()
+    # Priority queue of (distance, node)
+    minHeap = [(0, src)]
+
+    while minHeap:
+        # Get the node with the smallest distance
+        currentDist, currentNode = heappop(minHeap)
+        # Skip if already visited
+        if currentNode in visited:
+            continue
+        visited.add(currentNode)
+
+        # Stop as soon as the destination is settled
+        if currentNode == dest:
+            return buildPath(pred, dest)
+
+        # Process all neighbors of the current node
+        for neighbor, weight in graph[currentNode].items():
+            if neighbor not in visited:
+                newDist = currentDist + weight  # Calculate the new distance
+                # Update the shortest distance if a better path is found
+                if newDist < distance.get(neighbor, inf):
+                    distance[neighbor] = newDist
+                    pred[neighbor] = currentNode
+                    # Push the neighbor into the heap
+                    heappush(minHeap, (newDist, neighbor))
+
+
+def astar(graph, src, dest, heuristic=distanceTuple):
+    # A* search over a graph whose nodes are (x, y) points. Edge weights are
+    # road lengths, so the straight-line distance never overestimates and the
+    # first time dest is settled its path is a shortest one
+    distance = {src: 0}
+    pred = {src: None}
+    visited = set()
+    # Priority queue of (distance + estimate to dest, node)
+    minHeap = [(heuristic(src, dest), src)]
+
+    while minHeap:
+        _, currentNode = heappop(minHeap)
+        if currentNode in visited:
+            continue
+        visited.add(currentNode)
+
+        if currentNode == dest:
+            return buildPath(pred, dest)
+
+        currentDist = distance[currentNode]
+        for neighbor, weight in graph[currentNode].items():
+            if neighbor not in visited:
+                newDist = currentDist + weight
+                if newDist < distance.get(neighbor, inf):
+                    distance[neighbor] = newDist
+                    pred[neighbor] = currentNode
+                    estimate = newDist + heuristic(neighbor, dest)
+                    heappush(minHeap, (estimate, neighbor))
+
+
+def bidirectionalDijsktra(graph, src, dest):
+    # Search forwards from src and backwards from dest at the same time and
+    # stop once the two frontiers cannot improve on the best meeting point.
+    # Road graphs are undirected, so the backward search uses the same edges
+    if src == dest:
+        return [src]
+    distance = ({src: 0}, {dest: 0})
+    pred = ({src: None}, {dest: None})
+    visited = (set(), set())
+    heaps = ([(0, src)], [(0, dest)])
+    best = inf
+    meeting = None
+
+    while heaps[0] and heaps[1]:
+        # The best path cannot be shorter than the two frontiers combined
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        # Expand the side with the smaller frontier distance
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        currentDist, currentNode = heappop(heaps[side])
+        if currentNode in visited[side]:
+            continue
+        visited[side].add(currentNode)
+
+        sideDistance = distance[side]
+        otherDistance = distance[1 - side]
+        for neighbor, weight in graph[currentNode].items():
+            if neighbor in visited[side]:
+                continue
+            newDist = currentDist + weight
+            if newDist < sideDistance.get(neighbor, inf):
+                sideDistance[neighbor] = newDist
+                pred[side][neighbor] = currentNode
+                heappush(heaps[side], (newDist, neighbor))
+            # Check whether the two searches meet at this neighbor
+            if neighbor in otherDistance:
+                total = sideDistance[neighbor] + otherDistance[neighbor]
+                if total < best:
+                    best = total
+                    meeting = neighbor
+
+    if meeting is None:
+        return None
+    # Join the forward path to the meeting node with the reversed
+    # backward path from it
+    forward = buildPath(pred[0], meeting)
+    backward = buildPath(pred[1], meeting)
+    return forward + backward[-2::-1]
+
+
+def settleNodes(graph, src, targets, pred=None):
+    # Dijkstra search from src that yields each node with its distance as it
+    # is settled, and ends once every target is settled. When pred is given
+    # it is filled with the predecessor of every node reached
+    remaining = set(targets)
+    distance = {src: 0}
+    visited = set()
+    minHeap = [(0, src)]
+    while minHeap and remaining:
+        currentDist, currentNode = heappop(minHeap)
+        if currentNode in visited:
+            continue
+        visited.add(currentNode)
+        remaining.discard(currentNode)
+        yield currentNode, currentDist
+        for neighbor, weight in graph[currentNode].items():
+            if neighbor not in visited:
+                newDist = currentDist + weight
+                if newDist < distance.get(neighbor, inf):
+                    distance[neighbor] = newDist
+                    if pred is not None:
+                        pred[neighbor] = currentNode
+                    heappush(minHeap, (newDist, neighbor))
+
+
+def shortestDistances(graph, src, targets):
+    # Road distance from src to each of the targets it can reach. The search
+    # stops as soon as every target is settled instead of finding a path
+    targets = set(targets)
+    return {node: dist for node, dist in settleNodes(graph, src, targets)
+            if node in targets}
+
+
+class SlicedSearch:
+    # A* search that can be spread over many ticks. search is a generator
+    # that pauses after every node it expands, and advance resumes it for a
+    # bounded number of heap pops and microseconds. done and result match
+    # concurrent.futures.Future, so a search can stand in for a route that
+    # is being planned on a worker thread
+
+    def __init__(self, graph, src, dest, heuristic=distanceTuple):
+        self.dest = dest
+        self.pred = {src: None}
+        # Expanded node closest to dest in a straight line so far
+        self.closest = src
+        self.path = None
+        self.finished = False
+        self.pops = 0
+        self.steps = self.search(graph, src, heuristic)
+
+    def search(self, graph, src, heuristic):
+        dest = self.dest
+        pred = self.pred
+        distance = {src: 0}
+        visited = set()
+        closestEstimate = heuristic(src, dest)
+        minHeap = [(closestEstimate, src)]
+
+        while minHeap:
+            _, currentNode = heappop(minHeap)
+            if currentNode in visited:
+                continue
+            visited.add(currentNode)
+            self.pops += 1
+
+            if currentNode == dest:
+                self.path = buildPath(pred, dest)
+                break
+            estimate = heuristic(currentNode, dest)
+            if estimate < closestEstimate:
+                closestEstimate = estimate
+                self.closest = currentNode
+
+            currentDist = distance[currentNode]
+            for neighbor, weight in graph[currentNode].items():
+                if neighbor not in visited:
+                    newDist = currentDist + weight
+                    if newDist < distance.get(neighbor, inf):
+                        distance[neighbor] = newDist
+                        pred[neighbor] = currentNode
+                        estimate = newDist + heuristic(neighbor, dest)
+                        heappush(minHeap, (estimate, neighbor))
+            yield
+        self.finished = True
+
+    def advance(self, maxPops=1000, budget=2000):
+        # Expand at most maxPops nodes, stopping early once budget
+        # microseconds have passed. Returns whether the search has finished
+        deadline = perf_counter() + budget / 1e6
+        for _ in range(maxPops):
+            if self.finished or perf_counter() >= deadline:
+                break
+            next(self.steps, None)
+        return self.finished
+
+    def done(self):
+        return self.finished
+
+    def result(self):
+        # The shortest path, or None if dest cannot be reached or the search
+        # has not finished yet
+        return self.path
+
+    def bestRoute(self):
+        # The shortest path once it is found, otherwise the path to the
+        # expanded node closest to dest, the best partial route so far
+        if self.path is not None:
+            return self.path
+        return buildPath(self.pred, self.closest)
+
+
+class SlicedRoute(SlicedSearch):
+    # A route planned through a RouteCache a slice at a time. The searches
+    # between the snapped nodes of the two points run like a SlicedSearch,
+    # and once they finish their entry goes into the cache, so the next
+    # route between the same stretches of road is a lookup
+
+    def __init__(self, cache, src, srcLinks, dest, destLinks,
+                 heuristic=distanceTuple):
+        self.cache = cache
+        self.src = src
+        self.links = (srcLinks, destLinks)
+        super().__init__(cache.graph, src, dest, heuristic)
+
+    def search(self, graph, src, heuristic):
+        cache = self.cache
+        version = cache.version
+        srcLinks, destLinks = self.links
+        pairs = {}
+        closestEstimate = heuristic(src, self.dest)
+        for node, pred in cache.pairSearches(srcLinks, destLinks, pairs):
+            self.pops += 1
+            estimate = heuristic(node, self.dest)
+            if estimate < closestEstimate:
+                closestEstimate = estimate
+                self.closest = node
+                self.pred = pred
+            yield
+        # Only keep the entry if the cache still routes on the same graph
+        if cache.graph is graph and cache.version == version:
+            cache.store(srcLinks, destLinks, pairs)
+        self.path = cache.bestPath(src, srcLinks, self.dest, destLinks, pairs)
+        self.finished = True
+
+    def bestRoute(self):
+        # The route once it is found, otherwise the path from src to the
+        # settled node closest to dest in a straight line
+        if self.path is not None:
+            return self.path
+        path = buildPath(self.pred, self.closest)
+        if path[0] != self.src:
+            path = [self.src] + path
+        return path
+
+
+def buildPath(pred, dest):
+    # Follow the predecessor pointers back from dest to the source
+    path = []
+    node = dest
+    while node is not None:
+        path.append(node)
+        node = pred[node]
+    path.reverse()
+    return path
+
+
+class OverlayGraph(Mapping):
+    # A read-only view that layers temporary nodes and edges on top of an
+    # immutable base graph. Only the added edges are stored, so attaching a
+    # few route endpoints costs nothing proportional to the size of the map
+
+    def __init__(self, base):
+        self.base = base
+        self.added = {}
+
+    def addEdge(self, a, b, weight):
+        # Add an undirected edge between a and b to the overlay
+        self.added.setdefault(a, {})[b] = weight
+        self.added.setdefault(b, {})[a] = weight
+
+    def __getitem__(self, node):
+        extra = self.added.get(node)
+        if extra is None:
+            return self.base[node]
+        if node in self.base:
+            # Added edges take priority over the base edges of the node
+            return ChainMap(extra, self.base[node])
+        return extra
+
+    def __contains__(self, node):
+        return node in self.added or node in self.base
+
+    def __iter__(self):
+        yield from self.base
+        for node in self.added:
+            if node not in self.base:
+                yield node
+
+    def __len__(self):
+        return len(self.base) + sum(1 for node in self.added
+                                    if node not in self.base)
+
+
+class RoutingTable:
+    # All-pairs distances and next hops for a fixed road graph, so that
+    # routing between two intersections is a table walk instead of a search.
+    # The table is built once per map and must be rebuilt if the graph changes.
+    # Its size and build time grow with the square of the node count, so
+    # the game only builds one for graphs of up to app.routingTableNodes
+    # nodes and routes larger ones with a search. maxNodes is the default,
+    # a graph that takes about half a second to build a table for
+    maxNodes = 500
+
+    def __init__(self, graph):
+        # Give every node a dense index so the tables can be flat lists
+        self.nodes = list(graph)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        # dist[u][v] is the length of the shortest path from u to v and
+        # nextHop[u][v] is the index of the node after u on that path
+        self.dist = [[inf] * n for _ in range(n)]
+        self.nextHop = [[-1] * n for _ in range(n)]
+        for source in range(n):
+            self.buildFromSource(graph, source)
+
+    def buildFromSource(self, graph, source):
+        # Run a full single-source search and record the first hop taken
+        # towards every node reached from the source
+        distRow = self.dist[source]
+        hopRow = self.nextHop[source]
+        distRow[source] = 0
+        hopRow[source] = source
+        visited = set()
+        minHeap = [(0, source, source)]
+        while minHeap:
+            currentDist, current, firstHop = heappop(minHeap)
+            if current in visited:
+                continue
+            visited.add(current)
+            hopRow[current] = firstHop
+            for neighbor, weight in graph[self.nodes[current]].items():
+                j = self.index.get(neighbor)
+                if j is None or j in visited:
+                    continue
+                newDist = currentDist + weight
+                if newDist < distRow[j]:
+                    distRow[j] = newDist
+                    # Leaving the source, the first hop is the neighbor itself
+                    hop = j if current == source else firstHop
+                    heappush(minHeap, (newDist, j, hop))
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def distance(self, start, end):
+        # Shortest distance between two graph nodes
+        return self.dist[self.index[start]][self.index[end]]
+
+    def path(self, start, end):
+        # Walk the next-hop table from start to end
+        i, j = self.index[start], self.index[end]
+        if self.nextHop[i][j] == -1:
+            return None
+        path = [start]
+        while i != j:
+            i = self.nextHop[i][j]
+            path.append(self.nodes[i])
+        return path
+
+
+class RouteCache:
+    # Least recently used cache of routes between points on the road graph.
+    # A point is snapped to the graph nodes it attaches to, which are the
+    # ends of the stretch of road it lies on, and the entry for a pair of
+    # snapped points keeps the shortest path between every pair of their
+    # nodes. Any two points on the same two stretches of road share the
+    # entry, and route picks the best node pair for the actual points.
+    # eviction is 'lru', or 'fifo' to drop the oldest entry even when it is
+    # still being used
+    # Call reset whenever the graph changes, which also drops every entry
+
+    def __init__(self, graph, table=None, size=1024, eviction='lru',
+                 version=None):
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError(f'unknown eviction policy {eviction!r}')
+        self.size = size
+        self.eviction = eviction
+        # The planning thread and the game can route at the same time
+        self.lock = Lock()
+        self.reset(graph, table, version)
+
+    def reset(self, graph, table=None, version=None):
+        # Empty the cache and route on graph, using its routing table for
+        # misses when there is one. version tags what the graph was built
+        # from, such as app.roadsVersion
+        with self.lock:
+            self.graph = graph
+            self.table = table
+            self.version = version
+            self.entries = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def pairSearches(self, sources, targets, pairs):
+        # Fill pairs with the shortest distance and path between the snapped
+        # nodes of two points, as {(source, target): [distance, path]}. It
+        # is a generator that yields every node a search settles, with the
+        # predecessors of that search, so the searches can be spread over
+        # several ticks. With a routing table there is nothing to search
+        # and the path is left as None until route needs it
+        table = self.table
+        for a in sources:
+            if table is not None:
+                if a not in table:
+                    continue
+                for b in targets:
+                    if b in table:
+                        distance = table.distance(a, b)
+                        if distance < inf:
+                            pairs[a, b] = [distance, None]
+            elif a in self.graph:
+                pred = {a: None}
+                for b, distance in settleNodes(self.graph, a, targets, pred):
+                    if b in targets:
+                        pairs[a, b] = [distance, buildPath(pred, b)]
+                    yield b, pred
+
+    def pairPaths(self, sources, targets):
+        # The pairs of pairSearches, searched all at once
+        pairs = {}
+        for _ in self.pairSearches(sources, targets, pairs):
+            pass
+        return pairs
+
+    def store(self, srcLinks, destLinks, pairs):
+        # Add the entry for a pair of snapped points, evicting the oldest
+        # entries past the size limit
+        with self.lock:
+            self.misses += 1
+            self.entries[frozenset(srcLinks), frozenset(destLinks)] = pairs
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def route(self, src, srcLinks, dest, destLinks):
+        # Route between two points that are not graph nodes themselves.
+        # srcLinks and destLinks map the graph nodes each point attaches to
+        # onto the length of that attachment
+        if src == dest:
+            return [src]
+        key = (frozenset(srcLinks), frozenset(destLinks))
+        with self.lock:
+            pairs = self.entries.get(key)
+            if pairs is not None:
+                self.hits += 1
+                if self.eviction == 'lru':
+                    self.entries.move_to_end(key)
+        if pairs is None:
+            # Search outside the lock so a hit never waits for a search
+            pairs = self.pairPaths(srcLinks, destLinks)
+            self.store(srcLinks, destLinks, pairs)
+        return self.bestPath(src, srcLinks, dest, destLinks, pairs)
+
+    def bestPath(self, src, srcLinks, dest, destLinks, pairs):
+        # The route between the two points through the best pair of their
+        # snapped nodes. Try the node pairs in the order of the links, so
+        # ties are broken the same way whether or not the entry came from
+        # the cache
+        if src == dest:
+            return [src]
+        best = inf
+        bestPair = None
+        for a, srcWeight in srcLinks.items():
+            for b, destWeight in destLinks.items():
+                if (a, b) in pairs:
+                    total = srcWeight + pairs[a, b][0] + destWeight
+                    if total < best:
+                        best = total
+                        bestPair = (a, b)
+        if bestPair is None:
+            return None
+        found = pairs[bestPair]
+        if found[1] is None:
+            found[1] = self.table.path(*bestPair)
+        # A point sitting exactly on a graph node attaches to it with a
+        # zero-length link, so avoid repeating it in the path
+        path = list(found[1])
+        if path[0] != src:
+            path = [src] + path
+        if path[-1] != dest:
+            path = path + [dest]
+        return path
+
+    def __contains__(self, links):
+        # Whether the route between points with these (srcLinks, destLinks)
+        # is cached, without counting a lookup
+        srcLinks, destLinks = links
+        return (frozenset(srcLinks), frozenset(destLinks)) in self.entries
+
+    def stats(self):
+        # Hit and miss counters, for profiling
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0}
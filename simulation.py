@@ -0,0 +1,985 @@
+# Game state and rules for Express Courier without any graphics or audio.
+# FinalGame.py draws this state with cmu_graphics and plays the sounds,
+# while Simulation below steps the same rules headlessly (batch runs,
+# timer tuning and tests on machines without a display)
+
+import bisect
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from collision import buildCollision
+from mapfile import defaultMapPath, loadMap
+from routing import (distanceTuple, OverlayGraph, RouteCache, RoutingTable,
+                     SlicedRoute, SlicedSearch)
+from spatial import (EdgeIndex, buildAdjacency, buildNodeAdjacency,
+                     buildRoadGraph, buildRoadGrid, collectionPaused)
+
+
+class Road:
+    def __init__(self, app, startX, startY, endX, endY, width):
+        # Initialize the road object with its start and end coordinates,
+        # width, and orientation
+        self.startX = startX
+        self.startY = startY
+        self.endX = endX
+        self.endY = endY
+        self.width = width
+        # Sorted positions and graph nodes along the road's line, set when
+        # the graph is derived from the roads
+        self.graphLine = None
+        self.roadSegments = []  # The road split at its nodes, set by buildMap
+
+        # Determine if the road is vertical or horizontal
+        if startX == endX:
+            self.orientation = "vertical"
+            self.skewLeft = 0  # No skew needed for vertical roads
+        else:
+            self.orientation = "horizontal"
+            # Account for width to avoid gaps at road corners
+            self.skewLeft = app.roadWidth / 2
+    
+    def bounds(self):
+        # Return the (left, top, right, bottom) boundaries of the road region
+        if self.orientation == 'vertical':
+            left = self.startX - self.width / 2
+            right = self.startX + self.width / 2
+            top = min(self.startY, self.endY)  # Top boundary
+            bottom = max(self.startY, self.endY)  # Bottom boundary
+        else:
+            left = min(self.startX, self.endX) - self.skewLeft
+            right = max(self.startX, self.endX) + self.skewLeft
+            top = self.startY - self.width / 2
+            bottom = self.startY + self.width / 2
+        return left, top, right, bottom
+
+    def isPlayerInRegion(self, px, py):
+        # Check if a player's coordinates (px, py) are within the road's region
+        left, top, right, bottom = self.bounds()
+        
+        # Return whether the point is within the boundaries
+        return left <= px <= right and top <= py <= bottom
+    
+    def __repr__(self):
+        # Represent the road by its start and end coordinates
+        return (f"{self.startX}, {self.startY}, {self.endX}, {self.endY}")
+
+    def segments(self):
+        # Split the road's region at the graph nodes along it. Each segment
+        # runs from half a road width before one node to half a road width
+        # after the next, so together they cover the road region and
+        # neighbouring segments overlap around their shared node. A segment
+        # reaches the nodes of the line within half a road width of it,
+        # which are where it meets the segments it touches
+        left, top, right, bottom = self.bounds()
+        if self.graphLine is None:
+            return [RoadSegment(self, left, top, right, bottom)]
+        if self.orientation == 'horizontal':
+            low, high = left, right
+        else:
+            low, high = top, bottom
+        positions, nodes = self.graphLine
+        cuts = [low] + [position for position in positions
+                        if low < position < high] + [high]
+        half = self.width / 2
+        segments = []
+        for start, end in zip(cuts, cuts[1:]):
+            start, end = max(start - half, low), min(end + half, high)
+            reached = nodes[bisect.bisect_left(positions, start - half):
+                            bisect.bisect_right(positions, end + half)]
+            if self.orientation == 'horizontal':
+                segments.append(RoadSegment(self, start, top, end, bottom,
+                                            reached))
+            else:
+                segments.append(RoadSegment(self, left, start, right, end,
+                                            reached))
+        return segments
+
+
+class RoadSegment:
+    # The part of a road between two neighbouring graph nodes. Players keep
+    # track of the segment they are on, and road checks only look at it and
+    # the segments touching it, which are few however large the map is
+    def __init__(self, road, left, top, right, bottom, nodes=()):
+        self.road = road
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+        self.nodes = nodes  # Graph nodes the segment reaches
+        self.neighbors = []  # Segments that overlap this one, set by buildMap
+
+    def bounds(self):
+        return self.left, self.top, self.right, self.bottom
+
+    def isPlayerInRegion(self, px, py):
+        return (self.left <= px <= self.right and
+                self.top <= py <= self.bottom)
+
+
+class Player:
+    def __init__(self, px, py, playerRadius):
+        # Initialize the player's position and radius
+        self.playerRadius = playerRadius
+        self.px = px
+        self.py = py
+        # Road segment the player is on, so road checks only need to look
+        # at it and the segments it touches, and the app.roadsVersion it
+        # belongs to
+        self.segment = None
+        self.roadsVersion = None
+
+    @staticmethod
+    def signum(n):
+        # Returns the sign of a number (-1, 0, or 1)
+        return -1 if n < 0 else 0 if n == 0 else 1
+
+    def move(self, app, dx, dy):
+        # Predict the player's next position
+        nextPx = self.px + dx
+        nextPy = self.py + dy
+
+        # Check if the next position is within the road region
+        if self.isInRoadRegion(
+            app, nextPx + app.mapLeft + (self.playerRadius) * Player.signum(dx),
+            nextPy + app.mapTop + (self.playerRadius) * Player.signum(dy)
+        ):
+            # Handle horizontal scrolling and edge detection
+            if dx > 0 and nextPx > app.width - app.margin:  # Right edge
+                if app.mapLeft + dx < app.mapWidth - app.width:
+                    app.mapLeft += dx
+                else:
+                    app.mapLeft = app.mapWidth - app.width
+                    self.px = nextPx
+            elif dx < 0 and nextPx < app.margin:  # Left edge
+                if app.mapLeft + dx > 0:
+                    app.mapLeft += dx
+                else:
+                    app.mapLeft = 0
+                    self.px = nextPx
+            else:
+                self.px = nextPx
+
+            # Handle vertical scrolling and edge detection
+            if dy > 0 and nextPy > app.height - app.margin:  # Bottom edge
+                if app.mapTop + dy < app.mapHeight - app.height:
+                    app.mapTop += dy
+                else:
+                    app.mapTop = app.mapHeight - app.height
+                    self.py = nextPy
+            elif dy < 0 and nextPy < app.margin:  # Top edge
+                if app.mapTop + dy > 0:
+                    app.mapTop += dy
+                else:
+                    app.mapTop = 0
+                    self.py = nextPy
+            else:
+                self.py = nextPy
+            self.trackSegment(app, self.px + app.mapLeft,
+                              self.py + app.mapTop)
+
+    def segmentsAt(self, app, px, py):
+        # Road segments holding the map point (px, py), looking only at the
+        # player's current segment and the segments touching it. Before the
+        # player has a segment, after the roads change, or when none of
+        # those hold the point, the segments of the roads holding it are
+        # searched instead
+        segment = self.segment
+        segments = []
+        if segment is not None and self.roadsVersion == app.roadsVersion:
+            if segment.isPlayerInRegion(px, py):
+                segments.append(segment)
+            for neighbor in segment.neighbors:
+                if neighbor.isPlayerInRegion(px, py):
+                    segments.append(neighbor)
+        if not segments:
+            segments = [segment for road in app.roadGrid.query(px, py)
+                        if road.isPlayerInRegion(px, py)
+                        for segment in road.roadSegments
+                        if segment.isPlayerInRegion(px, py)]
+        return segments
+
+    def trackSegment(self, app, px, py):
+        # Keep the current segment while the player's map position (px, py)
+        # is on it, otherwise switch to the segment it moved onto
+        segments = self.segmentsAt(app, px, py)
+        if segments:
+            self.segment = segments[0]
+            self.roadsVersion = app.roadsVersion
+
+    def isInRoadRegion(self, app, px, py):
+        # Check if the point is on the player's road segment or one touching
+        # it. Otherwise, such as while the player has no segment or on roads
+        # that overlap without meeting at a graph node, check every road
+        segment = self.segment
+        if segment is not None and self.roadsVersion == app.roadsVersion:
+            if segment.isPlayerInRegion(px, py):
+                return True
+            for neighbor in segment.neighbors:
+                if neighbor.isPlayerInRegion(px, py):
+                    return True
+        return app.roadCollision.containsPoint(px, py)
+
+
+class Computer(Player):
+    def moveStep(self, app, startPoint, endPoint):
+        # Extract global start and end points
+        startX, startY = startPoint
+        endX, endY = endPoint
+        startX, startY = startX - app.mapLeft, startY - app.mapTop
+        endX_local = endX  # Convert to local coordinates
+        endY_local = endY
+
+        # Move horizontally towards the target point
+        if abs(self.px - endX_local) <= app.dx:
+            self.px = endX_local
+        elif endX_local > self.px:
+            self.move(app, app.dx, 0)
+        else:
+            self.move(app, -app.dx, 0)
+
+        # Move vertically towards the target point
+        if abs(self.py - endY_local) <= app.dy:
+            self.py = endY_local
+        elif endY_local > self.py:
+            self.move(app, 0, app.dy)
+        else:
+            self.move(app, 0, -app.dy)
+        self.trackSegment(app, self.px, self.py)
+
+    def move(self, app, dx, dy):
+        # Predict and validate the next position
+        nextPx = self.px + dx
+        nextPy = self.py + dy
+
+        # Check if the computer player stays within the road region
+        if self.isInRoadRegion(
+            app, nextPx + (self.playerRadius) * Player.signum(dx),
+            nextPy + (self.playerRadius) * Player.signum(dy)
+        ):
+            self.px = nextPx
+            self.py = nextPy
+
+
+class House:
+    NextID = 0  # Static ID tracker for houses
+    height = 100  # House height
+    width = 100  # House width
+
+    def __init__(self, app, cx, cy):
+        # Initialize the house attributes
+        self.cx = cx  # Center x-coordinate
+        self.cy = cy  # Center y-coordinate
+        self.color = 'brown'  # Default color of the house
+        self.request = False  # Indicates if the house has an active request
+        self.ID = House.NextID  # Unique ID for the house
+        # Version of app.roads the cached road region was computed for
+        self.roadsVersion = None
+
+        House.NextID += 1  # Increment the ID for the next house
+
+    def roadRegion(self, app):
+        # Reuse the cached region unless the roads changed since it was made
+        if self.roadsVersion == app.roadsVersion:
+            return
+        # Calculate the road region nearest to the house
+        nearestRoad = self.nearestRoadToHouse(app)
+        self.nearestRoad = nearestRoad
+        self.roadsVersion = app.roadsVersion
+        if nearestRoad.orientation == 'vertical':
+            self.roadLeft = nearestRoad.startX - app.roadWidth / 2
+            self.roadRight = nearestRoad.startX + app.roadWidth / 2
+            self.roadTop = self.cy - House.height / 2
+            self.roadBottom = self.cy + House.height / 2
+        else:
+            self.roadLeft = self.cx - House.width / 2
+            self.roadRight = self.cx + House.width / 2
+            self.roadTop = nearestRoad.startY - app.roadWidth / 2
+            self.roadBottom = nearestRoad.startY + app.roadWidth / 2
+
+    def isPlayerHere(self, app, player):
+        # Check if the player is within the house's road region
+        return (
+            self.roadLeft <= player.px + app.mapLeft <= self.roadRight and
+            self.roadTop <= player.py + app.mapTop <= self.roadBottom
+        )
+
+    def nearestRoadToHouse(self, app):
+        # Find the nearest road to the house through the edge index
+        road, a, b, offset, gap = app.edgeIndex.nearest(self.cx, self.cy)[0]
+        return road
+
+    def destinationPoint(self, app):
+        # Calculate the destination point for delivery
+        self.roadRegion(app)
+        avgX = (self.roadLeft + self.roadRight) / 2
+        avgY = (self.roadBottom + self.roadTop) / 2
+        return avgX, avgY
+
+    def distance(self, other):
+        # Calculate the Euclidean distance between two houses
+        return ((self.cx - other.cx) ** 2 + (self.cy - other.cy) ** 2) ** 0.5
+
+    def __eq__(self, other):
+        # Compare two houses by their coordinates
+        return self.cx == other.cx and self.cy == other.cy
+
+
+class Shop(House):
+    def __init__(self, app, cx, cy):
+        # Initialize a shop, inheriting from House
+        super().__init__(app, cx, cy)
+        self.color = 'blue'  # Shop-specific color
+
+
+# Function to initiate a new delivery
+def startNewDelivery(app, previousShop, previousHouse):
+    shops = [shop for shop in app.shops if shop != previousShop]
+    houses = [house for house in app.houses if house != previousHouse]
+    shop = app.rng.choice(shops)
+    house = app.rng.choice(houses)
+    shop.request = True
+    house.request = True
+    return shop, house
+
+
+
+def buildEdgeIndex(app):
+    # Index the graph edges along every road for snapping points onto the
+    # graph: the edges between the nodes on the road's line when the graph
+    # was derived from the roads, otherwise the road itself
+    index = EdgeIndex(app.roadWidth * 2, app.roadWidth / 2)
+    added = set()
+    for road in app.roads:
+        if road.graphLine is None:
+            nodes = [(road.startX, road.startY), (road.endX, road.endY)]
+        else:
+            nodes = road.graphLine[1]
+        for a, b in zip(nodes, nodes[1:]):
+            # Roads merged into one line share its edges
+            if (a, b) not in added:
+                added.add((a, b))
+                index.insert(road, a, b)
+    return index
+
+
+def buildSegments(app):
+    # Split every road into segments at the graph nodes and record which
+    # segments touch, for the players' segment tracking. With a derived
+    # graph, segments touch where they reach the same node; otherwise the
+    # overlaps of their regions are searched
+    app.segments = []
+    for road in app.roads:
+        road.roadSegments = road.segments()
+        app.segments.extend(road.roadSegments)
+    if any(road.graphLine is None for road in app.roads):
+        grid = buildRoadGrid(app.segments, app.roadWidth * 2)
+        adjacency = buildAdjacency(app.segments, grid)
+    else:
+        adjacency = buildNodeAdjacency(app.segments)
+    for segment, neighbors in zip(app.segments, adjacency):
+        segment.neighbors = neighbors
+
+
+def nearestRoadPoint(app, px, py):
+    # Closest point to (px, py) on the graph edges
+    road, a, b, offset, gap = app.edgeIndex.nearest(px, py)[0]
+    length = distanceTuple(a, b)
+    t = offset / length if length else 0
+    return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+
+
+def attachPointsToGraph(app, points, graph=None):
+    # Layer the points on top of the road graph, or on top of graph when
+    # given. Each point is projected onto the edges whose road region holds
+    # it, or onto the nearest edges when it is off the roads, and connected
+    # to both ends of those edges through the projection
+    overlay = OverlayGraph(app.graph if graph is None else graph)
+    for check in points:
+        for road, a, b, offset, gap in app.edgeIndex.snap(*check):
+            overlay.addEdge(check, a, gap + offset)
+            overlay.addEdge(check, b, gap + distanceTuple(a, b) - offset)
+    return overlay
+
+
+def routeCacheFor(app):
+    # The route cache of the current map, replaced by an empty one whenever
+    # the roads or the road graph changed since it was filled. The old cache
+    # is left as it was, since a plan on the worker thread may still use it
+    cache = app.routeCache
+    if (cache.version != app.roadsVersion or cache.graph is not app.graph or
+            cache.table is not app.routingTable):
+        cache = app.routeCache = RouteCache(
+            app.graph, app.routingTable, cache.size, cache.eviction,
+            app.roadsVersion)
+    return cache
+
+
+def fastestPath(app, overlay, src, dest):
+    # Route through the route cache, which looks the route up by the
+    # stretches of road the two points lie on and only searches the graph,
+    # or walks the routing table, on a miss
+    return routeCacheFor(app).route(src, overlay.added.get(src, {}),
+                                    dest, overlay.added.get(dest, {}))
+
+
+def planRoute(app, src, dest):
+    # Shortest path between two points. It only reads the map, so it can
+    # run on the planning thread, on a MapSnapshot of app, while the game
+    # goes on
+    # Attach both points to the graph without copying it
+    overlay = attachPointsToGraph(app, [src, dest])
+    return fastestPath(app, overlay, src, dest)
+
+
+def planShopLeg(app):
+    # Shortest path from the computer's position to the current shop
+    src = (app.player2.px, app.player2.py)  # Player's current position
+    dest = app.currentShop.destinationPoint(app)  # Shop's delivery point
+    return planRoute(app, src, dest)
+
+
+def planHouseLeg(app):
+    # Shortest path from the current shop to the current house. Only needed
+    # once the computer has picked up, so it is planned on first use and
+    # kept for the rest of the delivery
+    shop, house = app.currentShop, app.currentHouse
+    if app.houseLeg is not None:
+        legShop, legHouse, path = app.houseLeg
+        if legShop is shop and legHouse is house:
+            return path
+    path = planRoute(app, shop.destinationPoint(app),
+                     house.destinationPoint(app))
+    app.houseLeg = (shop, house, path)
+    return path
+
+
+class MapSnapshot:
+    # The parts of the game that planning a route reads, taken together on
+    # the main thread. The worker thread plans on a snapshot rather than on
+    # app, so a reset or a new map while it runs cannot hand it the graph
+    # of one map and the edge index or route cache of another
+
+    def __init__(self, app):
+        self.graph = app.graph
+        self.edgeIndex = app.edgeIndex
+        self.routingTable = app.routingTable
+        self.roadsVersion = app.roadsVersion
+        self.routeCache = routeCacheFor(app)
+
+
+def planningPool():
+    # The worker thread that plans routes when app.planning is 'thread',
+    # started on first use and shared by every game in the process
+    global planningExecutor
+    if planningExecutor is None:
+        planningExecutor = ThreadPoolExecutor(max_workers=1,
+                                              thread_name_prefix='planner')
+    return planningExecutor
+
+
+planningExecutor = None
+
+
+def plansInline(app):
+    # Whether routes are planned on the spot
+    return app.planning == 'inline'
+
+
+def startPlan(app, src, dest):
+    # Start planning a route away from the current tick: on the worker
+    # thread, or as a search that collectPlans advances a slice per tick.
+    # Both have the done and result methods of a Future
+    if app.planning == 'thread':
+        return planningPool().submit(planRoute, MapSnapshot(app), src, dest)
+    overlay = attachPointsToGraph(app, [src, dest])
+    srcLinks = overlay.added.get(src, {})
+    destLinks = overlay.added.get(dest, {})
+    cache = routeCacheFor(app)
+    if (srcLinks, destLinks) in cache:
+        # A cached route is a lookup, so there is nothing to spread out
+        plan = Future()
+        plan.set_result(fastestPath(app, overlay, src, dest))
+        return plan
+    # The finished searches fill the cache entry for this pair of points
+    return SlicedRoute(cache, src, srcLinks, dest, destLinks)
+
+
+def requestShopLeg(app):
+    # Plan the computer's route to the current shop. Unless routes are
+    # planned inline the computer idles, or follows the best partial route
+    # of a sliced search, until collectPlans picks it up
+    app.fastestPathToShop = None
+    app.fastestPathToHouse = None
+    app.partialRoute = None
+    if plansInline(app):
+        app.fastestPathToShop = planShopLeg(app)
+    else:
+        src = (app.player2.px, app.player2.py)
+        dest = app.currentShop.destinationPoint(app)
+        app.shopLegPlan = (app.currentShop, startPlan(app, src, dest))
+
+
+def requestHouseLeg(app):
+    # Plan the computer's route from the shop to the house after pickup
+    shop, house = app.currentShop, app.currentHouse
+    memoized = (app.houseLeg is not None and app.houseLeg[0] is shop and
+                app.houseLeg[1] is house)
+    app.partialRoute = None
+    if plansInline(app) or memoized:
+        app.fastestPathToHouse = planHouseLeg(app)
+    else:
+        app.fastestPathToHouse = None
+        plan = startPlan(app, shop.destinationPoint(app),
+                         house.destinationPoint(app))
+        app.houseLegPlan = (shop, house, plan)
+
+
+def advancePlan(plan, pops, deadline):
+    # Expand at most pops nodes of a sliced search, stopping at the
+    # perf_counter deadline, and return how many pops are left for the
+    # other plans of this tick
+    if isinstance(plan, SlicedSearch) and pops > 0:
+        expanded = plan.pops
+        plan.advance(pops, (deadline - time.perf_counter()) * 1e6)
+        pops -= plan.pops - expanded
+    return pops
+
+
+def joinRoute(app, route):
+    # Put a route that starts where the computer's partial route did in
+    # place of the partial route. The computer keeps the points it has
+    # passed, heads back along them to the last one that is on the new
+    # route, and goes on along the new route from there
+    walked = app.partialRoute
+    if walked is None:
+        return route
+    onRoute = {point: i for i, point in enumerate(route)}
+    # The point the computer is heading for counts too, since it is on the
+    # way. Every route starts at walked[0], so the search always ends
+    for j in range(min(app.iAI, len(walked) - 1), -1, -1):
+        if walked[j] in onRoute:
+            back = walked[j:app.iAI][::-1]
+            ahead = route[onRoute[walked[j]] + (1 if back else 0):]
+            return walked[:app.iAI] + back + ahead
+
+
+def followPartialRoute(app, plan):
+    # Move the computer along the best partial route of a sliced search
+    # while it runs, rather than leave it waiting for the whole route
+    if isinstance(plan, SlicedSearch):
+        route = plan.bestRoute()
+        if len(route) > 1:
+            app.partialRoute = joinRoute(app, route)
+
+
+def finishPlan(app, plan):
+    # The finished route of the computer's current leg, joined onto the
+    # partial route it has been following
+    path = plan.result()
+    if path is not None:
+        path = joinRoute(app, path)
+    app.partialRoute = None
+    return path
+
+
+def collectPlans(app):
+    # Take the routes that have finished planning, dropping any that were
+    # planned for a delivery that is over. Sliced searches share one slice
+    # of app.planningPops nodes and app.planningBudget microseconds a tick
+    deadline = time.perf_counter() + app.planningBudget / 1e6
+    pops = app.planningPops
+    if app.shopLegPlan is not None:
+        shop, plan = app.shopLegPlan
+        pops = advancePlan(plan, pops, deadline)
+        current = shop is app.currentShop and shop.request
+        if plan.done():
+            app.shopLegPlan = None
+            if shop is app.currentShop:
+                app.fastestPathToShop = finishPlan(app, plan)
+        elif current:
+            followPartialRoute(app, plan)
+    if app.houseLegPlan is not None:
+        shop, house, plan = app.houseLegPlan
+        pops = advancePlan(plan, pops, deadline)
+        current = (shop is app.currentShop and house is app.currentHouse)
+        if plan.done():
+            app.houseLegPlan = None
+            if current:
+                app.houseLeg = (shop, house, plan.result())
+                app.fastestPathToHouse = finishPlan(app, plan)
+        elif current and app.computerPicked:
+            followPartialRoute(app, plan)
+
+
+def fastestPathFromGraph(app):
+    # Both legs of the current delivery
+    return (planShopLeg(app), planHouseLeg(app))
+
+
+def updateRoads(app):
+    # Rebuild everything derived from app.roads; call after changing them
+    # Point-on-road tests and the spatial index of the road regions they
+    # use. Set app.collisionBackend to 'python' or 'numpy' to pick one
+    app.roadCollision = buildCollision(
+        app.roads, app.roadWidth * 2,
+        getattr(app, 'collisionBackend', 'auto'))
+    app.roadGrid = app.roadCollision.grid
+    # Cached house and shop road regions are stale once the version changes
+    app.roadsVersion = getattr(app, 'roadsVersion', 0) + 1
+
+
+# Routing tables of the maps played most recently, as {map key: (graph,
+# table)}, so resetting the game on the same map reuses its table
+routingTables = {}
+maxRoutingTables = 4
+
+
+def routingTableFor(mapData, graph, maxNodes=RoutingTable.maxNodes):
+    # The graph never changes during a game, so precompute every route once
+    # per map unless it has more than maxNodes nodes, which are routed with
+    # a search instead
+    if len(graph) > maxNodes:
+        return None
+    links = mapData['links']
+    key = (mapData['roadWidth'], tuple(mapData['nodes']),
+           tuple(mapData['roads']),
+           None if links is None else tuple(map(tuple, links)))
+    cached = routingTables.pop(key, None)
+    if cached is None or cached[0] != graph:
+        cached = (graph, RoutingTable(graph))
+    # Most recently used last, dropping the oldest when there are too many
+    routingTables[key] = cached
+    while len(routingTables) > maxRoutingTables:
+        del routingTables[next(iter(routingTables))]
+    return cached[1]
+
+
+def buildMap(app, mapData):
+    # Build the roads, houses, shops and road graph of a map loaded by
+    # mapfile.loadMap
+    # Background images are only drawn by the front end
+    app.backgrounds = list(mapData['backgrounds'])
+
+    # Map dimensions and scaling factors
+    app.mapWidth = mapData['width']
+    app.mapHeight = mapData['height']
+    app.smaller = min(app.mapWidth, app.mapHeight)
+    app.roadWidth = mapData['roadWidth']
+
+    # Every road runs between two graph nodes
+    nodes = mapData['nodes']
+    app.nodes = set(nodes)
+    app.roads = [Road(app, *nodes[start], *nodes[end], app.roadWidth)
+                 for start, end in mapData['roads']]
+    updateRoads(app)
+
+    app.houses = [House(app, x, y) for x, y in mapData['houses']]
+    app.shops = [Shop(app, x, y) for x, y in mapData['shops']]
+
+    if mapData['links'] is None:
+        # Derive the graph from the roads, joining road ends that stop
+        # within half a road width of another road
+        app.graph, roadLines = buildRoadGraph(app.roads, app.roadWidth / 2)
+        for road, line in zip(app.roads, roadLines):
+            road.graphLine = line
+    else:
+        # Edge weights are the straight-line distances between linked nodes
+        app.graph = {}
+        for node, neighbors in zip(nodes, mapData['links']):
+            app.graph[node] = {nodes[i]: distanceTuple(node, nodes[i])
+                               for i in neighbors}
+
+    app.routingTable = routingTableFor(mapData, app.graph,
+                                       app.routingTableNodes)
+    app.routeCache = RouteCache(app.graph, app.routingTable,
+                                app.routeCacheSize, app.routeCacheEviction,
+                                app.roadsVersion)
+    # A few small objects per graph edge
+    with collectionPaused():
+        app.edgeIndex = buildEdgeIndex(app)
+        buildSegments(app)
+
+    # Find the road region of every house and shop once per map
+    for place in app.houses + app.shops:
+        place.roadRegion(app)
+
+
+def resetGame(app):
+    # Reset player and game state variables and build a fresh map
+    if not hasattr(app, 'rng'):
+        app.rng = random  # Source of the random delivery requests
+    if not hasattr(app, 'mapPath'):
+        app.mapPath = defaultMapPath  # Map file loaded on every reset
+    if not hasattr(app, 'mapData'):
+        app.mapData = None  # Map dict to play instead of app.mapPath
+    if not hasattr(app, 'planning'):
+        # How routes are planned: 'inline', on the 'thread' pool, or
+        # 'sliced' over several ticks
+        app.planning = 'inline'
+    if not hasattr(app, 'routingTableNodes'):
+        # Largest graph that gets an all-pairs routing table
+        app.routingTableNodes = RoutingTable.maxNodes
+    if not hasattr(app, 'routeCacheSize'):
+        app.routeCacheSize = 1024  # Most route legs kept in the route cache
+        app.routeCacheEviction = 'lru'  # Or 'fifo'
+    if not hasattr(app, 'planningPops'):
+        app.planningPops = 1000  # Most nodes a sliced search expands a tick
+        app.planningBudget = 2000  # Microseconds a sliced search gets a tick
+    app.value = 0
+    app.counter = 0
+    app.dx = 25  # Player horizontal movement step
+    app.dy = 25  # Player vertical movement step
+    app.width = 800
+    app.height = 600
+    app.playerRadius = 17.5
+    app.AIMode = False
+    app.player1 = Player(100, 20, app.playerRadius)  # Initialize player
+    app.player2 = Computer(140, 30, app.playerRadius / 2)  # Initialize AI player
+
+    # Map scrolling properties
+    app.mapLeft, app.mapTop = 0, 0
+    app.margin = 250  # margin for minimap
+    app.cx, app.cy = app.width / 2, app.height / 2  # Center of the map
+
+    # Reset game states
+    app.computerPicked = False
+    app.currentOrientation = []
+    app.gameOver = False
+    app.gameWin = False
+    app.currentScreen = 'menu'  # Start at the menu screen
+    app.iAI = 1
+    app.score = 0
+    app.player2Score = 0
+    app.timer = 20  # Timer for game rounds
+    app.computerTimer = 15  # Timer for AI decisions
+    app.newHighScore = False  # Track new high scores
+
+    buildMap(app, loadMap(app.mapPath) if app.mapData is None
+             else app.mapData)
+    # Move the computer onto the nearest road if the map has none at its
+    # starting spot
+    if not app.roadCollision.containsPoint(app.player2.px, app.player2.py):
+        app.player2.px, app.player2.py = nearestRoadPoint(
+            app, app.player2.px, app.player2.py)
+    app.player1.trackSegment(app, app.player1.px, app.player1.py)
+    app.player2.trackSegment(app, app.player2.px, app.player2.py)
+    
+    app.currentShop, app.currentHouse = startNewDelivery(app, Shop(app, 0,0),
+                                                         House(app, 0,0))
+
+    # The house leg is planned when the computer picks up
+    app.houseLeg = None
+    app.shopLegPlan = None
+    app.houseLegPlan = None
+    app.partialRoute = None
+    requestShopLeg(app)
+
+
+def stepGame(app):
+    # Advance the game by one tick and return the events that happened
+    events = []
+    # Ensure game updates only during active gameplay
+    if not (app.gameOver or app.gameWin or 
+            app.currentScreen == 'menu' or app.currentScreen == 'instructions'):    
+        
+        # Increment the game counter
+        app.counter += 1
+        
+        # Check for game-over conditions
+        if app.timer <= 0:
+            app.gameOver = True
+            events.append('gameOver')
+        elif app.computerTimer == 0:
+            app.gameWin = True
+            events.append('gameWin')
+
+        # Decrement timers every 30 steps
+        if app.counter % 30 == 0:
+            if app.AIMode:
+                app.computerTimer -= 1
+            
+            app.timer -= 1
+
+        # Pick up routes planned on the worker thread or advance sliced
+        # searches; the computer waits where it is until its route is ready,
+        # or follows the best partial route of a sliced search
+        collectPlans(app)
+
+        # Handle AI movement towards the shop
+        if (app.AIMode and app.currentShop.request and
+                app.fastestPathToShop is not None):
+            start = (app.player2.px, app.player2.py)
+            end = app.fastestPathToShop[app.iAI]
+            app.player2.moveStep(app, start, end)
+            
+            # Check if AI has reached the current path node
+            endX, endY = end
+            if app.player2.px == endX and app.player2.py == endY:
+                app.iAI += 1
+                # If AI reaches the shop, update state
+                if app.iAI == len(app.fastestPathToShop):
+                    app.currentShop.request = False
+                    app.computerPicked = True
+                    requestHouseLeg(app)
+                    app.iAI = 1
+
+        # Handle AI movement towards the house after pickup
+        elif (app.AIMode and app.computerPicked and
+              app.fastestPathToHouse is not None):
+            start = (app.player2.px, app.player2.py)
+            end = app.fastestPathToHouse[app.iAI]
+            app.player2.moveStep(app, start, end)
+            
+            # Check if AI has reached the current path node
+            endX, endY = end
+            if app.player2.px == endX and app.player2.py == endY:
+                app.iAI += 1
+                # If AI reaches the house, complete delivery
+                if app.iAI == len(app.fastestPathToHouse):
+                    app.currentHouse.request = False
+                    app.player2Score += 1
+                    
+                    # Award extra time based on delivery distance
+                    distance = app.currentHouse.distance(app.currentShop)
+                    extra = distance // 200
+                    app.computerTimer += extra
+                    
+                    # Start a new delivery request
+                    x, y = startNewDelivery(app, app.currentShop,
+                                            app.currentHouse)
+                    app.currentShop, app.currentHouse = x, y
+                    
+                    # Recalculate the path to the new shop for AI
+                    requestShopLeg(app)
+
+                    # Reset AI path index
+                    app.iAI = 1
+
+        # Head along the best partial route while the leg is still planned
+        elif (app.AIMode and app.partialRoute is not None and
+              app.iAI < len(app.partialRoute) and
+              (app.currentShop.request or app.computerPicked)):
+            start = (app.player2.px, app.player2.py)
+            end = app.partialRoute[app.iAI]
+            app.player2.moveStep(app, start, end)
+            if (app.player2.px, app.player2.py) == end:
+                app.iAI += 1
+    return events
+
+
+def moveHeldKeys(app, keys):
+    # Only process key holds during active gameplay
+    if not (app.gameOver or app.gameWin):
+        # Determine the player's current road and orientation
+        px = app.player1.px + app.mapLeft
+        py = app.player1.py + app.mapTop
+        currentOrientation = set(
+            segment.road.orientation
+            for segment in app.player1.segmentsAt(app, px, py))
+        
+        # Adjust movement speed based on road orientation
+        if len(currentOrientation) == 2:
+            dx = app.dx
+            dy = app.dy
+        elif 'horizontal' in currentOrientation:
+            dx = app.dx
+            dy = app.dy / 4
+        elif 'vertical' in currentOrientation:
+            dx = app.dx / 4
+            dy = app.dy
+                
+        # Handle player movement based on key presses
+        if 'right' in keys:
+            app.player1.move(app, dx, 0)
+        if 'left' in keys:
+            app.player1.move(app, -dx, 0)
+        if 'up' in keys:
+            app.player1.move(app, 0, -dy)
+        if 'down' in keys:
+            app.player1.move(app, 0, dy)
+
+
+def pressEnter(app):
+    # Interact with the current shop or house and return what happened
+    # If the shop is requesting and player is at the shop, handle request
+    if (app.currentShop.request and
+    app.currentShop.isPlayerHere(app, app.player1)):
+        app.currentShop.request = False
+        app.computerPicked = False
+        app.iAI = 1
+        return 'pickUp'
+    # If the house is requesting and player is at the house,
+    # handle delivery
+    elif (not app.currentShop.request and
+          app.currentHouse.isPlayerHere(app, app.player1)
+          and not app.computerPicked):
+        app.currentHouse.request = False
+        app.score += 1
+        if app.score > app.highScore:
+            app.highScore = app.score
+            app.newHighScore = True
+        distance = app.currentHouse.distance(app.currentShop)
+        extra = distance // 150
+        app.timer += extra
+        # Start new delivery and update path
+        x, y = startNewDelivery(app, app.currentShop, app.currentHouse)
+        app.currentShop, app.currentHouse = x, y
+        requestShopLeg(app)
+        return 'delivered'
+    # Handle case when computer has picked
+    elif app.computerPicked:
+        return 'computerFirst'
+    # Handle case when player is at house and computer hasn't picked
+    elif (app.currentHouse.isPlayerHere(app, app.player1) and
+          not app.computerPicked):
+        return 'pickFirst'
+    # Handle navigation hints based on shop request status
+    elif app.currentShop.request:
+        return 'goToShop'
+    else:
+        return 'goToHouse'
+
+
+class Simulation:
+    # Headless stand-in for the cmu_graphics app object. It holds the same
+    # state the game keeps on app and steps it as fast as the CPU allows
+
+    def __init__(self, AIMode=True, seed=None, mapPath=defaultMapPath,
+                 mapData=None, collisionBackend='auto', planning='inline',
+                 routingTableNodes=RoutingTable.maxNodes):
+        self.rng = random.Random(seed)
+        self.mapPath = mapPath
+        self.mapData = mapData  # For example a citygen.generateCity map
+        self.collisionBackend = collisionBackend
+        self.routingTableNodes = routingTableNodes
+        # Inline by default so a seeded run replays the same game every time
+        self.planning = planning
+        self.highScore = 0
+        resetGame(self)
+        self.AIMode = AIMode
+        self.currentScreen = 'vsComputer' if AIMode else 'regular'
+
+    def step(self):
+        # Advance one tick, same as one onStep call in the game
+        return stepGame(self)
+
+    def run(self, ticks):
+        # Step until the game ends or the tick limit is reached and return
+        # the number of ticks run
+        for tick in range(ticks):
+            if self.gameOver or self.gameWin:
+                return tick
+            self.step()
+        return ticks
+
+
+if __name__ == '__main__':
+    # Quick batch run: play seeded Vs Computer games with an idle player
+    games, ticks = 20, 0
+    start = time.perf_counter()
+    for seed in range(games):
+        simulation = Simulation(seed=seed)
+        ticks += simulation.run(100000)
+        print(f'seed {seed}: computer delivered {simulation.player2Score}')
+    elapsed = time.perf_counter() - start
+    print(f'{ticks} ticks in {elapsed:.2f}s ({ticks / elapsed:.0f} ticks/s)')
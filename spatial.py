@@ -0,0 +1,318 @@
+import bisect
+import gc
+from contextlib import contextmanager
+
+
+class UniformGrid:
+    # Buckets axis-aligned rectangles into square cells so that point
+    # queries only look at the few rectangles sharing the point's cell
+
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        self.cells = {}
+
+    def cellRange(self, left, top, right, bottom):
+        # Range of cell columns and rows covered by a rectangle
+        size = self.cellSize
+        return (int(left // size), int(top // size),
+                int(right // size), int(bottom // size))
+
+    def insert(self, item, left, top, right, bottom):
+        # Register the item in every cell its rectangle overlaps
+        col0, row0, col1, row1 = self.cellRange(left, top, right, bottom)
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                self.cells.setdefault((col, row), []).append(item)
+
+    def query(self, px, py):
+        # Items whose rectangle may contain the point (px, py)
+        size = self.cellSize
+        return self.cells.get((int(px // size), int(py // size)), ())
+
+    def queryRect(self, left, top, right, bottom):
+        # Items whose rectangle may intersect the given rectangle, each
+        # listed once in the order it was first found
+        found = {}
+        col0, row0, col1, row1 = self.cellRange(left, top, right, bottom)
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                for item in self.cells.get((col, row), ()):
+                    found[id(item)] = item
+        return list(found.values())
+
+
+class EdgeIndex:
+    # Grid of straight graph edges for snapping points onto the graph. An
+    # edge is stored in every cell its rectangle, widened by tolerance,
+    # overlaps, so finding the edges that contain a point looks at one cell
+    # and finding the nearest edges searches outwards ring by ring. Each
+    # edge carries an item, such as the road it runs along
+
+    def __init__(self, cellSize, tolerance):
+        self.grid = UniformGrid(cellSize)
+        self.tolerance = tolerance
+        # Lowest and highest cell column and row, worked out on the first
+        # search after the edges change
+        self.extent = None
+
+    def insert(self, item, a, b):
+        (ax, ay), (bx, by) = a, b
+        tolerance = self.tolerance
+        self.grid.insert((item, a, b),
+                         min(ax, bx) - tolerance, min(ay, by) - tolerance,
+                         max(ax, bx) + tolerance, max(ay, by) + tolerance)
+        self.extent = None
+
+    @staticmethod
+    def project(a, b, px, py):
+        # Offset along the edge from a of the point of the edge closest to
+        # (px, py), and the x and y gaps from that point to (px, py)
+        (ax, ay), (bx, by) = a, b
+        ex, ey = bx - ax, by - ay
+        lengthSquared = ex * ex + ey * ey
+        t = 0
+        if lengthSquared:
+            t = min(max(((px - ax) * ex + (py - ay) * ey) / lengthSquared,
+                        0), 1)
+        return (t * lengthSquared ** 0.5, px - (ax + t * ex),
+                py - (ay + t * ey))
+
+    def containing(self, px, py):
+        # (item, a, b, offset, gap) of every edge whose road region holds
+        # the point: within tolerance of the edge along both axes. offset
+        # is measured along the edge from a and gap is the distance from
+        # the point to the edge
+        snaps = []
+        for item, a, b in self.grid.query(px, py):
+            offset, gapX, gapY = self.project(a, b, px, py)
+            if abs(gapX) <= self.tolerance and abs(gapY) <= self.tolerance:
+                snaps.append((item, a, b, offset,
+                              (gapX * gapX + gapY * gapY) ** 0.5))
+        return snaps
+
+    def nearest(self, px, py):
+        # (item, a, b, offset, gap) of the edges closest to the point, more
+        # than one when they are equally close
+        cells = self.grid.cells
+        if not cells:
+            return []
+        if self.extent is None:
+            self.extent = (min(c for c, _ in cells), min(r for _, r in cells),
+                           max(c for c, _ in cells), max(r for _, r in cells))
+        size = self.grid.cellSize
+        col, row = int(px // size), int(py // size)
+        col0, row0, col1, row1 = self.extent
+        maxRadius = max(col - col0, col1 - col, row - row0, row1 - row, 0)
+        best = float('inf')
+        snaps = []
+        for radius in range(maxRadius + 1):
+            # Every cell of this ring is at least radius - 1 cells away
+            if best <= (radius - 1) * size:
+                break
+            for c in range(col - radius, col + radius + 1):
+                rows = range(row - radius, row + radius + 1) \
+                    if c in (col - radius, col + radius) \
+                    else (row - radius, row + radius)
+                for r in rows:
+                    for item, a, b in cells.get((c, r), ()):
+                        offset, gapX, gapY = self.project(a, b, px, py)
+                        gap = (gapX * gapX + gapY * gapY) ** 0.5
+                        if gap < best - 1e-9:
+                            best = gap
+                            snaps = []
+                        if gap <= best + 1e-9 and not any(
+                                snap[1] == a and snap[2] == b
+                                for snap in snaps):
+                            snaps.append((item, a, b, offset, gap))
+        return snaps
+
+    def snap(self, px, py):
+        # The edges that contain the point, or the nearest ones if none do
+        return self.containing(px, py) or self.nearest(px, py)
+
+
+@contextmanager
+def collectionPaused():
+    # Pause garbage collection around a bulk build. Building the indexes
+    # of a big map allocates millions of small objects, and the collections
+    # they trigger would cost more than the build itself
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def buildRoadGrid(roads, cellSize):
+    # Index every road by the rectangle its region covers
+    grid = UniformGrid(cellSize)
+    for road in roads:
+        grid.insert(road, *road.bounds())
+    return grid
+
+
+def buildAdjacency(regions, grid):
+    # For every region (anything with bounds, such as a road), the other
+    # regions that overlap or touch it. grid indexes the regions, so each
+    # one only tests the regions near it
+    adjacency = []
+    for region in regions:
+        left, top, right, bottom = region.bounds()
+        neighbors = []
+        for other in grid.queryRect(left, top, right, bottom):
+            otherLeft, otherTop, otherRight, otherBottom = other.bounds()
+            if (other is not region and otherLeft <= right and
+                    left <= otherRight and otherTop <= bottom and
+                    top <= otherBottom):
+                neighbors.append(other)
+        adjacency.append(neighbors)
+    return adjacency
+
+
+def buildNodeAdjacency(regions):
+    # For every region, the other regions that share one of its graph
+    # nodes (region.nodes). Unlike buildAdjacency it needs no geometry, so
+    # it takes time linear in the number of regions and nodes
+    regionsAt = {}
+    for region in regions:
+        for node in region.nodes:
+            regionsAt.setdefault(node, []).append(region)
+    adjacency = []
+    for region in regions:
+        found = []
+        for node in region.nodes:
+            found += regionsAt[node]
+        unique = {id(other): other for other in found}
+        adjacency.append([other for other in unique.values()
+                          if other is not region])
+    return adjacency
+
+
+def mergeLines(segments, tolerance):
+    # Group (coordinate, low, high, road index) segments that run along the
+    # same line, treating lines closer than tolerance as one, and merge the
+    # overlapping parts. Returns [coordinate, low, high, road indexes] lines
+    lines = []
+    clusterStart = None
+    for coordinate, low, high, index in sorted(segments):
+        if clusterStart is None or coordinate - clusterStart > tolerance:
+            # Segments on a nearby line snap to the first one
+            clusterStart = coordinate
+            clusterLines = []
+        for line in clusterLines:
+            if low <= line[2] + tolerance and high >= line[1] - tolerance:
+                line[1] = min(line[1], low)
+                line[2] = max(line[2], high)
+                line[3].append(index)
+                break
+        else:
+            line = [clusterStart, low, high, [index]]
+            clusterLines.append(line)
+            lines.append(line)
+    return lines
+
+
+def sweepJunctions(horizontal, vertical, tolerance):
+    # The x of every junction on each horizontal line and the y of every
+    # junction on each vertical line, for lines made by mergeLines. The
+    # sweep runs from left to right. A horizontal line enters it at its
+    # start less tolerance and leaves after its end plus tolerance, and the
+    # lines under the sweep are kept sorted by y, so each vertical line
+    # bisects out the run of lines within its span and visits only those.
+    # At the same x lines enter before and leave after the vertical lines
+    # are matched, since the ends count as reaching
+    events = []
+    for h, (_, low, high, _) in enumerate(horizontal):
+        events.append((low - tolerance, 0, h))
+        events.append((high + tolerance, 2, h))
+    for v, (x, _, _, _) in enumerate(vertical):
+        events.append((x, 1, v))
+    events.sort()
+
+    crossingsH = [[] for _ in horizontal]
+    crossingsV = [[] for _ in vertical]
+    activeYs = []  # y of the lines under the sweep, sorted
+    activeLines = []  # Index of each of those lines
+    for x, kind, i in events:
+        if kind == 1:
+            _, low, high, _ = vertical[i]
+            first = bisect.bisect_left(activeYs, low - tolerance)
+            last = bisect.bisect_right(activeYs, high + tolerance)
+            if first < last:
+                crossingsV[i].extend(activeYs[first:last])
+                for h in activeLines[first:last]:
+                    crossingsH[h].append(x)
+        elif kind == 0:
+            y = horizontal[i][0]
+            j = bisect.bisect_right(activeYs, y)
+            activeYs.insert(j, y)
+            activeLines.insert(j, i)
+        else:
+            # Lines sharing a y sit together, so look for this one among
+            # them
+            j = bisect.bisect_left(activeYs, horizontal[i][0])
+            while activeLines[j] != i:
+                j += 1
+            del activeYs[j]
+            del activeLines[j]
+    return crossingsH, crossingsV
+
+
+def buildRoadGraph(roads, tolerance):
+    # Derive the road graph from axis-aligned roads. A sweep line finds
+    # every crossing and T-junction in O((n + k) log n) time for n lines
+    # with k junctions; ends of lines within tolerance of a crossing line
+    # count as a junction. Each line is then split at its junctions into
+    # edges.
+    # Returns the graph and, for every road, the sorted positions and nodes
+    # along its line (None for roads that are not axis-aligned)
+    horizontalSegments = []
+    verticalSegments = []
+    for index, road in enumerate(roads):
+        if road.startY == road.endY and road.startX != road.endX:
+            horizontalSegments.append(
+                (road.startY, min(road.startX, road.endX),
+                 max(road.startX, road.endX), index))
+        elif road.startX == road.endX:
+            verticalSegments.append(
+                (road.startX, min(road.startY, road.endY),
+                 max(road.startY, road.endY), index))
+    horizontal = mergeLines(horizontalSegments, tolerance)
+    vertical = mergeLines(verticalSegments, tolerance)
+
+    graph = {}
+    roadLines = [None] * len(roads)
+
+    def addLine(line, crossings, isHorizontal):
+        # Split one line at its junctions and link consecutive nodes. Line
+        # ends further than tolerance from any junction are dead ends
+        coordinate, low, high, indexes = line
+        positions = sorted(set(crossings))
+        if not positions or positions[0] - low > tolerance:
+            positions.insert(0, low)
+        if high - positions[-1] > tolerance:
+            positions.append(high)
+        if isHorizontal:
+            nodes = [(position, coordinate) for position in positions]
+        else:
+            nodes = [(coordinate, position) for position in positions]
+        edgesAt = [graph.get(node) or graph.setdefault(node, {})
+                   for node in nodes]
+        for a, b, edgesA, edgesB, start, end in zip(
+                nodes, nodes[1:], edgesAt, edgesAt[1:], positions,
+                positions[1:]):
+            edgesA[b] = edgesB[a] = end - start
+        for index in indexes:
+            roadLines[index] = (positions, nodes)
+
+    # The sweep and the graph allocate a few small objects per junction
+    with collectionPaused():
+        crossingsH, crossingsV = sweepJunctions(horizontal, vertical,
+                                                tolerance)
+        for line, crossings in zip(horizontal, crossingsH):
+            addLine(line, crossings, True)
+        for line, crossings in zip(vertical, crossingsV):
+            addLine(line, crossings, False)
+    return graph, roadLines
@@ -0,0 +1,9 @@
+# Shared setup for the test suite. The game modules live in the project
+# folder rather than in a package, so put it on the import path
+# Run from the project folder: python -m pytest tests
+
+import os
+import sys
+
+projectFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, projectFolder)
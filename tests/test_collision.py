@@ -0,0 +1,58 @@
+# Both collision backends against a test of every road
+
+import random
+
+import pytest
+
+from citygen import generateCity
+from collision import ArrayCollision, GridCollision, buildCollision, np
+from simulation import Simulation
+
+
+def linearContains(roads, px, py):
+    return any(road.isPlayerInRegion(px, py) for road in roads)
+
+
+def randomPoints(app, count, seed):
+    # Points all over the map and a little past its edges, plus points on
+    # the corners of the road regions, where the skewLeft extension counts
+    rng = random.Random(seed)
+    points = [(rng.uniform(-100, app.mapWidth + 100),
+               rng.uniform(-100, app.mapHeight + 100)) for _ in range(count)]
+    for road in rng.sample(app.roads, min(50, len(app.roads))):
+        left, top, right, bottom = road.bounds()
+        points += [(left, top), (right, bottom), (left - 1e-6, top),
+                   (right, bottom + 1e-6)]
+    return points
+
+
+@pytest.mark.parametrize('mapData', [None, generateCity(3, 10, 10)])
+def testBackendsMatchLinearScan(mapData):
+    app = Simulation(seed=0, mapData=mapData)
+    points = randomPoints(app, 3000, 0)
+    expected = [linearContains(app.roads, x, y) for x, y in points]
+    assert any(expected) and not all(expected)
+    backends = [GridCollision(app.roads, app.roadWidth * 2)]
+    if np is not None:
+        backends.append(ArrayCollision(app.roads, app.roadWidth * 2))
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    for backend in backends:
+        assert [backend.containsPoint(x, y) for x, y in points] == expected
+        assert [bool(hit) for hit in backend.containsPoints(xs, ys)] == \
+            expected
+
+
+def testBackendChoice():
+    app = Simulation(seed=0)
+    assert isinstance(buildCollision(app.roads, 10, 'python'),
+                      GridCollision)
+    if np is None:
+        with pytest.raises(ImportError):
+            buildCollision(app.roads, 10, 'numpy')
+    else:
+        assert isinstance(buildCollision(app.roads, 10, 'auto'),
+                          ArrayCollision)
+    empty = buildCollision([], 10)
+    assert not empty.containsPoint(0, 0)
+    assert not any(empty.containsPoints([0, 5], [0, 5]))
@@ -0,0 +1,177 @@
+# Dispatch mode: tours of several orders, row searches within the replan
+# budget, and stops the computer cannot reach
+
+import itertools
+import random
+
+from citygen import generateCity
+from dispatch import (DispatchPlanner, Dispatcher, DistanceMatrix, Order,
+                      tourLength)
+from routing import inf
+from simulation import Simulation
+
+
+def twoTowns():
+    # Two separate squares of road, so places in one cannot be reached
+    # from the other
+    nodes = []
+    roads = []
+    for left in (100, 1300):
+        first = len(nodes)
+        nodes += [(left, 100), (left + 600, 100), (left + 600, 700),
+                  (left, 700)]
+        roads += [(first + i, first + (i + 1) % 4) for i in range(4)]
+    return {'width': 2000, 'height': 800, 'roadWidth': 50,
+            'backgrounds': [], 'nodes': nodes, 'roads': roads,
+            'links': None,
+            'houses': [(400, 200), (400, 600), (1600, 200), (1600, 600)],
+            'shops': [(200, 400), (1400, 400)]}
+
+
+def checkTour(tour, carried, waiting):
+    # Every carried order is dropped off, and every waiting order in the
+    # tour is picked up before it is dropped off
+    assert len(tour) == len(set(tour))
+    for order in carried:
+        assert (order, True) not in tour
+    for stop in tour:
+        order, isPickup = stop
+        assert order in carried or order in waiting
+        if order in waiting:
+            assert ((order, True) in tour) and ((order, False) in tour)
+            assert tour.index((order, True)) < tour.index((order, False))
+
+
+def testToursAreValidAndShort():
+    app = Simulation(seed=0, mapData=generateCity(5, 8, 8))
+    matrix = DistanceMatrix(app)
+    planner = DispatchPlanner(matrix, budget=1)
+    rng = random.Random(0)
+    start = (app.player2.px, app.player2.py)
+    for _ in range(10):
+        orders = [Order(rng.choice(app.shops), rng.choice(app.houses), 0)
+                  for _ in range(6)]
+        carried, waiting = orders[:2], orders[2:]
+        tour = planner.plan(start, carried, waiting)
+        assert planner.complete
+        checkTour(tour, carried, waiting)
+        assert len(tour) == 2 + 2 * len(waiting)
+
+        points = {}
+        for order in orders:
+            points[order, True] = order.shop.destinationPoint(app)
+            points[order, False] = order.house.destinationPoint(app)
+        fromStart = matrix.fromPoint(start, set(points.values()))
+
+        def distance(a, b):
+            if a is None:
+                return fromStart[points[b]]
+            return matrix.row(points[a])[points[b]]
+        # No worse than serving the orders one at a time
+        oneByOne = [(order, False) for order in carried] + [
+            stop for order in waiting for stop in ((order, True),
+                                                   (order, False))]
+        assert tourLength(tour, distance) <= \
+            tourLength(oneByOne, distance) + 1e-6
+
+
+def testSmallToursAreOptimal():
+    # With two orders the insertion and moves find the best tour
+    app = Simulation(seed=0, mapData=generateCity(6, 6, 6))
+    planner = DispatchPlanner(DistanceMatrix(app), budget=1)
+    matrix = planner.matrix
+    rng = random.Random(1)
+    start = (app.player2.px, app.player2.py)
+    for _ in range(10):
+        orders = [Order(rng.choice(app.shops), rng.choice(app.houses), 0)
+                  for _ in range(2)]
+        tour = planner.plan(start, [], orders)
+        points = {}
+        for order in orders:
+            points[order, True] = order.shop.destinationPoint(app)
+            points[order, False] = order.house.destinationPoint(app)
+        fromStart = matrix.fromPoint(start, set(points.values()))
+
+        def distance(a, b):
+            if a is None:
+                return fromStart[points[b]]
+            return matrix.row(points[a])[points[b]]
+        best = min(tourLength(list(stops), distance)
+                   for stops in itertools.permutations(points)
+                   if all(stops.index((order, True)) <
+                          stops.index((order, False)) for order in orders))
+        assert tourLength(tour, distance) <= best + 1e-6
+
+
+def testUnreachableStopsStayWithTheirOrders():
+    app = Simulation(seed=0, mapData=twoTowns())
+    dispatcher = Dispatcher(app)
+    near, far = app.shops
+    nearHouse, farHouse = app.houses[0], app.houses[2]
+
+    # The pickup cannot be reached, so both stops leave the tour and the
+    # order is dropped
+    order = Order(far, nearHouse, 0)
+    dispatcher.waiting = [order]
+    dispatcher.tour = [(order, True), (order, False)]
+    dispatcher.headToNextStop()
+    assert dispatcher.tour == [] and dispatcher.path is None
+    assert dispatcher.waiting == [] and dispatcher.dropped == 1
+    planner = dispatcher.planner
+    assert planner.plan((app.player2.px, app.player2.py), [], [order]) == []
+    assert planner.unreachable == [order]
+
+    # A carried order whose house cannot be reached stays carried, and the
+    # computer goes on to the next order
+    lost = Order(near, farHouse, 0)
+    other = Order(near, nearHouse, 0)
+    dispatcher.waiting = [other]
+    dispatcher.carried = [lost]
+    dispatcher.tour = [(lost, False), (other, True), (other, False)]
+    dispatcher.headToNextStop()
+    assert dispatcher.tour == [(other, True), (other, False)]
+    assert dispatcher.path is not None
+    for _ in range(2000):
+        dispatcher.step()
+        if not dispatcher.tour:
+            break
+    assert dispatcher.delivered == 1 and dispatcher.carried == [lost]
+    assert dispatcher.dropped == 1
+
+
+def testDispatchAcrossUnreachableTowns():
+    # Orders keep arriving for both towns. None of them goes missing, the
+    # computer keeps delivering the ones it can reach, and the others do
+    # not fill up the queue
+    app = Simulation(seed=2, mapData=twoTowns())
+    dispatcher = Dispatcher(app, orderInterval=20)
+    placed = []
+    placeOrder = dispatcher.placeOrder
+    dispatcher.placeOrder = lambda: placed.append(placeOrder())
+    dispatcher.run(3000)
+    assert dispatcher.delivered > 0 and dispatcher.dropped > 0
+    assert len(placed) == (dispatcher.delivered + dispatcher.dropped +
+                           len(dispatcher.waiting) + len(dispatcher.carried))
+    assert len(placed) > 3000 // 20 - 10
+
+
+def testSearchesCarryOnAcrossReplans():
+    # A budget far too small for one row search leaves the new order out
+    # of the tour until later ticks finish its searches
+    app = Simulation(seed=0, mapData=generateCity(7, 12, 12))
+    dispatcher = Dispatcher(app, orderInterval=10 ** 6, budget=1e-5)
+    dispatcher.placeOrder()
+    order = dispatcher.waiting[0]
+    assert not dispatcher.planner.complete and dispatcher.tour == []
+    assert dispatcher.matrix.searches
+    for _ in range(10000):
+        dispatcher.step()
+        if dispatcher.planner.complete:
+            break
+    assert dispatcher.planner.complete and not dispatcher.matrix.searches
+    assert order in dispatcher.carried or (order, True) in dispatcher.tour
+    # The rows match searches run in one go
+    full = DistanceMatrix(app)
+    for point, row in dispatcher.matrix.rows.items():
+        assert full.row(point) == row
+    assert inf not in row.values()
@@ -0,0 +1,42 @@
+# Fleet couriers move exactly like the Computer player, all in one batch
+
+import pytest
+
+from citygen import generateCity
+from fleet import Fleet
+from simulation import Computer, Simulation
+
+# Fleet mode needs numpy, which the game itself does not
+pytest.importorskip('numpy')
+
+
+def checkFleetMatchesComputers(app, couriers, ticks):
+    # Step a Computer alongside every courier, heading for the same route
+    # point, and compare positions after each tick
+    fleet = Fleet(app, couriers, seed=1)
+    computers = [Computer(0, 0, app.playerRadius / 2)
+                 for _ in range(couriers)]
+    completed = 0
+    for _ in range(ticks):
+        for courier, computer in enumerate(computers):
+            computer.px = float(fleet.px[courier])
+            computer.py = float(fleet.py[courier])
+            end = fleet.routes[courier][fleet.cursor[courier]]
+            computer.moveStep(app, (computer.px, computer.py), end)
+        completed += fleet.step()
+        for courier, computer in enumerate(computers):
+            assert (computer.px, computer.py) == \
+                (fleet.px[courier], fleet.py[courier])
+    assert completed == fleet.delivered.sum() > 0
+    assert fleet.ticks == ticks
+
+
+def testFleetMatchesComputersOnShippedMap():
+    checkFleetMatchesComputers(Simulation(seed=3), 50, 400)
+
+
+def testFleetMatchesComputersOnGeneratedCity():
+    for backend in ('numpy', 'python'):
+        app = Simulation(seed=0, mapData=generateCity(2, 6, 6),
+                         collisionBackend=backend)
+        checkFleetMatchesComputers(app, 30, 300)
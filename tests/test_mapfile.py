@@ -0,0 +1,66 @@
+# Maps loaded through the binary cache match the parsed JSON file
+
+import os
+import shutil
+
+from citygen import generateCity
+from mapfile import (cachePathFor, defaultMapPath, loadMap, parseMap,
+                     readCache, writeMap)
+
+
+def roundTrip(path):
+    # Load a map file twice, compiling its cache and then reading it
+    expected = parseMap(path)
+    cachePath = cachePathFor(path)
+    assert not os.path.exists(cachePath)
+    assert loadMap(path) == expected
+    assert readCache(cachePath, os.stat(path)) == expected
+    assert loadMap(path) == expected
+    return expected
+
+
+def testShippedMapRoundTrip(tmp_path):
+    path = str(tmp_path / 'default.json')
+    shutil.copy(defaultMapPath, path)
+    mapData = roundTrip(path)
+    assert mapData['links'] is None and mapData['backgrounds']
+
+
+def testMapWithLinksRoundTrip(tmp_path):
+    # A square of four nodes with one-way links round it, no roads and no
+    # backgrounds
+    path = str(tmp_path / 'links.json')
+    writeMap(path, {
+        'width': 400, 'height': 300, 'roadWidth': 12.5, 'backgrounds': [],
+        'nodes': [(0, 0), (100, 0), (100, 100.5), (0, 100.5)],
+        'roads': [], 'links': [[1], [2], [3, 0], []],
+        'houses': [(50, 20)], 'shops': [],
+    })
+    mapData = roundTrip(path)
+    assert mapData['links'] == [[1], [2], [3, 0], []]
+
+
+def testGeneratedCityRoundTrip(tmp_path):
+    path = str(tmp_path / 'city.json')
+    writeMap(path, generateCity(5, 6, 6))
+    roundTrip(path)
+
+
+def testStaleCacheIsIgnored(tmp_path):
+    path = str(tmp_path / 'city.json')
+    writeMap(path, generateCity(6, 4, 4))
+    loadMap(path)
+    # Rewrite the file with a different map, as an editor would
+    writeMap(path, generateCity(7, 5, 5))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert readCache(cachePathFor(path), os.stat(path)) is None
+    assert loadMap(path) == parseMap(path)
+    assert readCache(cachePathFor(path), os.stat(path)) == parseMap(path)
+
+
+def testLoadWithoutCache(tmp_path):
+    path = str(tmp_path / 'city.json')
+    writeMap(path, generateCity(8, 4, 4))
+    assert loadMap(path, useCache=False) == parseMap(path)
+    assert not os.path.exists(cachePathFor(path))
@@ -0,0 +1,110 @@
+# The frame profiler's percentiles and exports, and the draw call counter
+
+import csv
+import json
+import random
+import warnings
+from types import SimpleNamespace
+
+from profiler import DrawCounter, FrameProfiler, percentile
+
+
+def testPercentileIsNearestRank():
+    samples = list(range(1, 101))
+    assert [percentile(samples, f) for f in (0.5, 0.95, 0.99, 1)] == \
+        [50, 95, 99, 100]
+    assert percentile([], 0.5) == 0
+    assert percentile([7], 0.99) == 7
+    rng = random.Random(0)
+    for _ in range(100):
+        samples = sorted(rng.random() for _ in range(rng.randrange(1, 50)))
+        fraction = rng.random()
+        # The smallest sample with at least that fraction of samples at or
+        # below it
+        needed = fraction * len(samples)
+        expected = min(s for s in samples
+                       if sum(t <= s for t in samples) >= needed)
+        assert percentile(samples, fraction) == expected
+
+
+def testStatsKeepOnlyRecentSamples():
+    profiler = FrameProfiler(size=100)
+    for i in range(250):
+        profiler.record('onStep', 0, (i + 1) / 1000)
+    stats = profiler.stats('onStep')
+    assert stats['calls'] == 100
+    # Milliseconds 151 to 250 are the ones kept
+    assert abs(stats['p50'] - 200) < 1e-9
+    assert abs(stats['p95'] - 245) < 1e-9
+    assert abs(stats['p99'] - 249) < 1e-9
+    assert profiler.stats('redrawAll') == {'calls': 0, 'p50': 0, 'p95': 0,
+                                           'p99': 0}
+
+
+def testTimedCallbacksAreExported(tmp_path):
+    profiler = FrameProfiler()
+
+    @profiler.timed
+    def onKeyPress(app, key):
+        return key * 2
+
+    assert onKeyPress(None, 'a') == 'aa'
+    assert onKeyPress(None, 'b') == 'bb'
+    profiler.record('custom', profiler.startTime, profiler.startTime + 0.5)
+
+    profiler.exportCsv(tmp_path / 'trace.csv')
+    with open(tmp_path / 'trace.csv', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['seconds', 'callback', 'milliseconds']
+    assert [row[1] for row in rows[1:]] == ['onKeyPress', 'onKeyPress',
+                                            'custom']
+    assert float(rows[3][2]) == 500
+
+    profiler.exportJson(tmp_path / 'trace.json')
+    with open(tmp_path / 'trace.json') as f:
+        report = json.load(f)
+    assert report['stats']['onKeyPress']['calls'] == 2
+    assert report['stats']['custom'] == {'calls': 1, 'p50': 500, 'p95': 500,
+                                         'p99': 500}
+    assert [call['callback'] for call in report['trace']] == \
+        ['onKeyPress', 'onKeyPress', 'custom']
+
+
+def testDrawCounterCountsEveryFrameOverBudget():
+    counter = DrawCounter(budgets={'menu': 2, 'regular': 5},
+                          defaultOrigin='HUD')
+
+    @counter.counted
+    def drawRect():
+        pass
+
+    @counter.counted
+    def drawLabel():
+        pass
+
+    app = SimpleNamespace(currentScreen='menu')
+
+    @counter.frame
+    def redrawAll(app, rects, labels):
+        with counter.origin('roads'):
+            for _ in range(rects):
+                drawRect()
+        for _ in range(labels):
+            drawLabel()
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('default')
+        for rects in (1, 3, 4, 0, 2):
+            redrawAll(app, rects, 1)
+        app.currentScreen = 'regular'
+        redrawAll(app, 2, 3)
+        redrawAll(app, 4, 3)
+        app.currentScreen = 'instructions'
+        redrawAll(app, 40, 0)
+    assert counter.overBudget == {'menu': 3, 'regular': 1}
+    # Only the first frame over budget of each screen warns
+    assert len(caught) == 2
+    assert all(w.category is RuntimeWarning for w in caught)
+    assert counter.lastFrame == {'screen': 'instructions', 'total': 40,
+                                 'byType': {'drawRect': 40},
+                                 'byOrigin': {'roads': 40}}
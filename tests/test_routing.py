@@ -0,0 +1,192 @@
+# The routing table and the route cache against plain Dijkstra searches
+
+import random
+
+from citygen import generateCity
+from routing import (OverlayGraph, RouteCache, RoutingTable, SlicedRoute,
+                     astar, bidirectionalDijsktra, dijsktra, distanceTuple,
+                     inf, shortestDistances)
+from simulation import Simulation, attachPointsToGraph
+
+
+def pathLength(graph, path):
+    return sum(graph[a][b] for a, b in zip(path, path[1:]))
+
+
+def makeCity(seed=0, blocks=8, **options):
+    return Simulation(seed=seed, mapData=generateCity(seed, blocks, blocks,
+                                                      density=0.7), **options)
+
+
+def testRoutingTableMatchesDijkstra():
+    app = makeCity()
+    table = RoutingTable(app.graph)
+    nodes = sorted(app.graph)
+    rng = random.Random(0)
+    for _ in range(200):
+        a, b = rng.choice(nodes), rng.choice(nodes)
+        expected = pathLength(app.graph, dijsktra(app.graph, a, b))
+        assert abs(table.distance(a, b) - expected) < 1e-6
+        path = table.path(a, b)
+        assert path[0] == a and path[-1] == b
+        assert abs(pathLength(app.graph, path) - expected) < 1e-6
+
+
+def testRoutingTableCap():
+    # Graphs over the cap are routed with a search, and play the same game
+    small = makeCity(1, routingTableNodes=10)
+    assert len(small.graph) > 10 and small.routingTable is None
+    assert makeCity(1).routingTable is not None
+    games = [makeCity(1, routingTableNodes=nodes) for nodes in (10, 500)]
+    for game in games:
+        game.run(400)
+    assert games[0].player2Score == games[1].player2Score
+    assert (games[0].player2.px, games[0].player2.py) == \
+        (games[1].player2.px, games[1].player2.py)
+
+
+def testOverlayGraphMatchesCopiedGraph():
+    # An overlay reads like a copy of the graph with the edges added to it,
+    # and leaves the graph itself alone
+    app = makeCity(2)
+    before = {node: dict(edges) for node, edges in app.graph.items()}
+    points = [(5.5, 7.25), (app.mapWidth / 2 + 0.5, 3.0)]
+    nodes = sorted(app.graph)
+    overlay = OverlayGraph(app.graph)
+    copied = {node: dict(edges) for node, edges in app.graph.items()}
+    for i, point in enumerate(points):
+        for node in nodes[i::len(nodes) // 3]:
+            weight = distanceTuple(point, node) + 1
+            overlay.addEdge(point, node, weight)
+            copied.setdefault(point, {})[node] = weight
+            copied[node][point] = weight
+    assert app.graph == before
+    assert len(overlay) == len(copied) and set(overlay) == set(copied)
+    assert {node: dict(overlay[node]) for node in overlay} == copied
+    expected = dijsktra(copied, *points)
+    assert pathLength(overlay, dijsktra(overlay, *points)) == \
+        pathLength(copied, expected)
+
+
+def floydWarshall(graph):
+    # Every shortest distance by relaxing through each node in turn
+    nodes = list(graph)
+    dist = {a: {b: 0 if a == b else graph[a].get(b, float('inf'))
+                for b in nodes} for a in nodes}
+    for k in nodes:
+        for a in nodes:
+            through = dist[a][k]
+            for b in nodes:
+                if through + dist[k][b] < dist[a][b]:
+                    dist[a][b] = through + dist[k][b]
+    return dist
+
+
+def randomGraph(seed, count=40):
+    # Points joined to a few near neighbours by edges at least as long as
+    # the straight line, in a few separate parts
+    rng = random.Random(seed)
+    points = [(rng.uniform(0, 1000), rng.uniform(0, 1000))
+              for _ in range(count)]
+    graph = {point: {} for point in points}
+    for a in points:
+        for b in sorted(points, key=lambda b: distanceTuple(a, b))[1:3]:
+            if a[0] < 700 or b[0] >= 700:
+                weight = distanceTuple(a, b) * rng.uniform(1, 1.3)
+                graph[a][b] = graph[b][a] = weight
+    return graph
+
+
+def testSearchesMatchFloydWarshall():
+    for seed in range(5):
+        graph = randomGraph(seed)
+        dist = floydWarshall(graph)
+        nodes = list(graph)
+        for a in nodes[:10]:
+            found = shortestDistances(graph, a, nodes)
+            assert set(found) == {b for b in nodes if dist[a][b] < inf}
+            for b in nodes:
+                expected = dist[a][b]
+                assert abs(found.get(b, inf) - expected) < 1e-6 or \
+                    expected == inf
+                for search in (dijsktra, astar, bidirectionalDijsktra):
+                    path = search(graph, a, b)
+                    if expected == inf:
+                        assert path is None
+                    else:
+                        assert path[0] == a and path[-1] == b
+                        assert abs(pathLength(graph, path) - expected) < 1e-6
+
+
+def routePoints(app, count, rng):
+    # Delivery points of random houses and shops, and random points on the
+    # roads of the map
+    points = [place.destinationPoint(app) for place in app.houses + app.shops]
+    for _ in range(count):
+        road = rng.choice(app.roads)
+        t = rng.random()
+        points.append((road.startX + (road.endX - road.startX) * t,
+                       road.startY + (road.endY - road.startY) * t))
+    return points
+
+
+def checkRoutes(app, cache, rng, sliced=False):
+    # Routes between a few points, so some of them come from the cache
+    points = rng.sample(routePoints(app, 20, rng), 10)
+    for _ in range(150):
+        src, dest = rng.choice(points), rng.choice(points)
+        overlay = attachPointsToGraph(app, [src, dest])
+        srcLinks = overlay.added.get(src, {})
+        destLinks = overlay.added.get(dest, {})
+        if sliced:
+            plan = SlicedRoute(cache, src, srcLinks, dest, destLinks)
+            while not plan.advance(50, 10 ** 6):
+                assert plan.bestRoute()[0] == src
+            path = plan.result()
+            if src != dest:
+                assert (srcLinks, destLinks) in cache
+        else:
+            path = cache.route(src, srcLinks, dest, destLinks)
+        expected = dijsktra(overlay, src, dest)
+        assert path[0] == src and path[-1] == dest
+        assert abs(pathLength(overlay, path) -
+                   pathLength(overlay, expected)) < 1e-6
+
+
+def testRouteCacheMatchesDijkstra():
+    app = makeCity(2)
+    for table in (None, RoutingTable(app.graph)):
+        cache = RouteCache(app.graph, table, size=16)
+        checkRoutes(app, cache, random.Random(2))
+        stats = cache.stats()
+        assert stats['hits'] > 0 and stats['evictions'] > 0
+        assert stats['size'] <= 16
+
+
+def testSlicedRoutesFillTheCache():
+    app = makeCity(3)
+    cache = RouteCache(app.graph)
+    checkRoutes(app, cache, random.Random(3), sliced=True)
+    assert cache.stats()['size'] > 0
+
+
+def testRouteCacheEvictionPolicies():
+    app = makeCity(4, 4)
+    # Four points on different stretches of road, so each route has its
+    # own entry
+    points = []
+    links = []
+    for point in routePoints(app, 0, random.Random(4)):
+        found = attachPointsToGraph(app, [point]).added[point]
+        if found not in links and len(points) < 4:
+            points.append(point)
+            links.append(found)
+    for eviction, kept in [('lru', 0), ('fifo', 1)]:
+        cache = RouteCache(app.graph, size=2, eviction=eviction)
+        cache.route(points[0], links[0], points[1], links[1])
+        cache.route(points[1], links[1], points[2], links[2])
+        # Use the first entry again, then push one entry out
+        cache.route(points[0], links[0], points[1], links[1])
+        cache.route(points[2], links[2], points[3], links[3])
+        assert (links[kept], links[kept + 1]) in cache
+        assert (links[1 - kept], links[2 - kept]) not in cache
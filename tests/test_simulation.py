@@ -0,0 +1,146 @@
+# Seeded headless games replay exactly, so their scores pin down the game
+# rules, the road graph and the computer's routes
+
+from citygen import generateCity
+from simulation import (MapSnapshot, Simulation, collectPlans, planRoute,
+                        resetGame, routeCacheFor, startPlan, updateRoads)
+
+
+def playGame(**options):
+    simulation = Simulation(**options)
+    ticks = simulation.run(100000)
+    return ticks, simulation.player2Score, simulation.gameOver
+
+
+def testSeededGamesOnShippedMap():
+    # The computer's deliveries before the timer runs out
+    for seed, delivered in [(0, 5), (1, 5), (2, 4)]:
+        assert playGame(seed=seed) == (601, delivered, True)
+
+
+def testSeededGameOnGeneratedCity():
+    assert playGame(seed=1, mapData=generateCity(1, 8, 8)) == (601, 4, True)
+
+
+def testSeededGamesReplay():
+    mapData = generateCity(2, 6, 6)
+    first = Simulation(seed=7, mapData=mapData)
+    second = Simulation(seed=7, mapData=mapData)
+    for _ in range(300):
+        first.step()
+        second.step()
+        assert (first.player2.px, first.player2.py) == \
+            (second.player2.px, second.player2.py)
+    assert first.player2Score == second.player2Score
+
+
+def testThreadPlanningMatchesInline():
+    app = Simulation(seed=3, mapData=generateCity(3, 8, 8),
+                     planning='thread')
+    for shop, house in zip(app.shops, app.houses):
+        src, dest = shop.destinationPoint(app), house.destinationPoint(app)
+        assert startPlan(app, src, dest).result(timeout=30) == \
+            planRoute(app, src, dest)
+    # Headless ticks come faster than the worker thread can plan, so wait
+    # for each plan as a frame of the game would. The computer then starts
+    # every leg on the same tick as when planning inline
+    app = Simulation(seed=0, planning='thread')
+    while not (app.gameOver or app.gameWin):
+        for plan in (app.shopLegPlan, app.houseLegPlan):
+            if plan is not None:
+                plan[-1].result(timeout=30)
+        app.step()
+    assert (app.counter, app.player2Score) == playGame(seed=0)[:2]
+
+
+def testSnapshotKeepsItsMap():
+    # A plan on the worker thread routes on the map it was started on, even
+    # when the game moves to another map before it runs
+    first = generateCity(1, 8, 8)
+    app = Simulation(seed=0, mapData=first)
+    snapshot = MapSnapshot(app)
+    points = [(place.destinationPoint(app), house.destinationPoint(app))
+              for place, house in zip(app.shops, app.houses)]
+    app.mapData = generateCity(2, 6, 6)
+    resetGame(app)
+    stats = app.routeCache.stats()
+    expected = Simulation(seed=0, mapData=first)
+    for src, dest in points:
+        assert planRoute(snapshot, src, dest) == planRoute(expected, src, dest)
+    assert snapshot.routeCache.graph is snapshot.graph
+    assert app.routeCache.stats() == stats
+
+
+def testStaleRouteCacheIsReplaced():
+    app = Simulation(seed=0, mapData=generateCity(1, 6, 6))
+    cache = app.routeCache
+    version = cache.version
+    updateRoads(app)
+    assert routeCacheFor(app) is not cache
+    assert routeCacheFor(app).version == app.roadsVersion
+    assert cache.version == version and cache.graph is app.graph
+
+
+def slicedGame(**options):
+    # A game that plans sliced searches without a routing table, a few
+    # nodes a tick so every leg spans many ticks
+    app = Simulation(seed=0, mapData=generateCity(1, 8, 8), planning='sliced',
+                     routingTableNodes=0, **options)
+    app.planningPops = 3
+    return app
+
+
+def isRoadWalk(app, path):
+    # City roads are axis-aligned, so every step of a route runs along one,
+    # give or take the offset of a point inside the road from its middle
+    slack = app.roadWidth / 2
+    return all(abs(a[0] - b[0]) <= slack or abs(a[1] - b[1]) <= slack
+               for a, b in zip(path, path[1:]))
+
+
+def testSlicedPlanningWithRoutingTable():
+    # A table walk finishes on the first slice, but still off the tick the
+    # leg was requested on
+    app = Simulation(seed=0, planning='sliced')
+    assert app.fastestPathToShop is None and app.shopLegPlan is not None
+    app.step()
+    assert app.fastestPathToShop is not None and app.shopLegPlan is None
+
+
+def testSlicedPlansShareOneSlice():
+    app = slicedGame()
+    shop, house = app.currentShop, app.currentHouse
+    src = (app.player2.px, app.player2.py)
+    app.houseLegPlan = (shop, house, startPlan(
+        app, shop.destinationPoint(app), house.destinationPoint(app)))
+    plans = [app.shopLegPlan[1], app.houseLegPlan[2]]
+    for _ in range(5):
+        before = sum(plan.pops for plan in plans)
+        collectPlans(app)
+        assert sum(plan.pops for plan in plans) - before <= app.planningPops
+    app.planningBudget = 0
+    before = [plan.pops for plan in plans]
+    collectPlans(app)
+    assert [plan.pops for plan in plans] == before
+    assert app.shopLegPlan[1] is plans[0] and src == \
+        (app.player2.px, app.player2.py)
+
+
+def testSlicedPlanningFollowsPartialRoute():
+    app = slicedGame()
+    start = (app.player2.px, app.player2.py)
+    movedEarly = False
+    while app.shopLegPlan is not None:
+        app.step()
+        if app.partialRoute is not None:
+            assert app.partialRoute[0] == start
+            assert isRoadWalk(app, app.partialRoute)
+        movedEarly |= (app.player2.px, app.player2.py) != start
+    assert movedEarly
+    path = app.fastestPathToShop
+    assert path[0] == start and isRoadWalk(app, path)
+    assert path[-1] == app.currentShop.destinationPoint(app)
+    # The rest of the game plays on, with the computer still delivering
+    while not (app.gameOver or app.gameWin):
+        app.step()
+    assert app.player2Score > 0
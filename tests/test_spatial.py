@@ -0,0 +1,181 @@
+# The road graph, the edge index and the road segments against brute force
+# versions that look at every pair of lines, every edge and every segment
+
+import random
+from types import SimpleNamespace
+
+from citygen import generateCity
+from simulation import Road, Simulation
+from spatial import (EdgeIndex, buildAdjacency, buildRoadGraph, buildRoadGrid,
+                     mergeLines)
+
+
+def randomRoads(seed, count=60, size=1000, tolerance=10):
+    # Axis-aligned roads on a coarse grid, jittered by up to the tolerance
+    # so some lines merge, some ends just reach a road and some just miss
+    rng = random.Random(seed)
+    app = SimpleNamespace(roadWidth=tolerance * 2)
+    roads = []
+    for _ in range(count):
+        fixed = rng.randrange(0, size, 50) + rng.uniform(-tolerance, tolerance)
+        start, end = sorted(rng.sample(range(0, size, 50), 2))
+        start += rng.choice((0, rng.uniform(-tolerance * 2, tolerance * 2)))
+        if rng.random() < 0.5:
+            roads.append(Road(app, start, fixed, end, fixed, app.roadWidth))
+        else:
+            roads.append(Road(app, fixed, start, fixed, end, app.roadWidth))
+    return roads
+
+
+def bruteForceGraph(roads, tolerance):
+    # Test every horizontal line against every vertical line for a junction
+    horizontal = mergeLines([
+        (road.startY, min(road.startX, road.endX),
+         max(road.startX, road.endX), index)
+        for index, road in enumerate(roads)
+        if road.startY == road.endY and road.startX != road.endX], tolerance)
+    vertical = mergeLines([
+        (road.startX, min(road.startY, road.endY),
+         max(road.startY, road.endY), index)
+        for index, road in enumerate(roads)
+        if road.startX == road.endX], tolerance)
+    crossingsH = [[] for _ in horizontal]
+    crossingsV = [[] for _ in vertical]
+    for h, (y, left, right, _) in enumerate(horizontal):
+        for v, (x, top, bottom, _) in enumerate(vertical):
+            if (left - tolerance <= x <= right + tolerance and
+                    top - tolerance <= y <= bottom + tolerance):
+                crossingsH[h].append(x)
+                crossingsV[v].append(y)
+
+    graph = {}
+    for lines, crossings, isHorizontal in [(horizontal, crossingsH, True),
+                                           (vertical, crossingsV, False)]:
+        for (coordinate, low, high, _), found in zip(lines, crossings):
+            positions = sorted(set(found))
+            if not positions or positions[0] - low > tolerance:
+                positions.insert(0, low)
+            if high - positions[-1] > tolerance:
+                positions.append(high)
+            nodes = [(position, coordinate) if isHorizontal
+                     else (coordinate, position) for position in positions]
+            for node in nodes:
+                graph.setdefault(node, {})
+            for a, b, start, end in zip(nodes, nodes[1:], positions,
+                                        positions[1:]):
+                graph[a][b] = graph[b][a] = end - start
+    return graph
+
+
+def testRoadGraphMatchesBruteForce():
+    for seed in range(20):
+        roads = randomRoads(seed)
+        graph, roadLines = buildRoadGraph(roads, 10)
+        assert graph == bruteForceGraph(roads, 10)
+        for road, line in zip(roads, roadLines):
+            positions, nodes = line
+            assert positions == sorted(positions)
+            assert all(node in graph for node in nodes)
+
+
+def testRoadGraphOfGeneratedCity():
+    app = Simulation(seed=0, mapData=generateCity(3, 12, 12, density=0.6))
+    tolerance = app.roadWidth / 2
+    graph, _ = buildRoadGraph(app.roads, tolerance)
+    assert graph == bruteForceGraph(app.roads, tolerance)
+
+
+def linearSnap(edges, tolerance, px, py):
+    # The edges holding the point, or else the nearest ones, by projecting
+    # the point onto every edge
+    snaps = []
+    for a, b in edges:
+        offset, gapX, gapY = EdgeIndex.project(a, b, px, py)
+        snaps.append((a, b, offset, (gapX * gapX + gapY * gapY) ** 0.5,
+                      abs(gapX) <= tolerance and abs(gapY) <= tolerance))
+    holding = [snap for snap in snaps if snap[4]]
+    if holding:
+        return holding
+    best = min(snap[3] for snap in snaps)
+    return [snap for snap in snaps if snap[3] <= best + 1e-9]
+
+
+def testEdgeIndexSnapMatchesLinearScan():
+    app = Simulation(seed=0, mapData=generateCity(4, 10, 10, density=0.6))
+    edges = [(a, b) for a in app.graph for b in app.graph[a] if a < b]
+    tolerance = app.roadWidth / 2
+    index = EdgeIndex(app.roadWidth * 2, tolerance)
+    for a, b in edges:
+        index.insert(None, a, b)
+    rng = random.Random(0)
+    for _ in range(500):
+        px = rng.uniform(-200, app.mapWidth + 200)
+        py = rng.uniform(-200, app.mapHeight + 200)
+        found = sorted((a, b, offset, gap)
+                       for _, a, b, offset, gap in index.snap(px, py))
+        expected = sorted(snap[:4] for snap in
+                          linearSnap(edges, tolerance, px, py))
+        assert [snap[:2] for snap in found] == \
+            [snap[:2] for snap in expected]
+        for snap, other in zip(found, expected):
+            assert abs(snap[2] - other[2]) < 1e-9
+            assert abs(snap[3] - other[3]) < 1e-9
+
+
+def overlaps(a, b):
+    aLeft, aTop, aRight, aBottom = a.bounds()
+    bLeft, bTop, bRight, bBottom = b.bounds()
+    return (aLeft <= bRight and bLeft <= aRight and aTop <= bBottom and
+            bTop <= aBottom)
+
+
+def testSegmentsCoverTheirRoads():
+    app = Simulation(seed=0, mapData=generateCity(5, 10, 10, density=0.6))
+    for road in app.roads:
+        left, top, right, bottom = road.bounds()
+        segments = road.roadSegments
+        if road.orientation == 'horizontal':
+            spans = [(segment.left, segment.right) for segment in segments]
+            low, high = left, right
+        else:
+            spans = [(segment.top, segment.bottom) for segment in segments]
+            low, high = top, bottom
+        assert spans[0][0] == low and spans[-1][1] == high
+        assert all(start <= end for (_, end), (start, _) in
+                   zip(spans, spans[1:]))
+
+
+def testSegmentAdjacencyMatchesOverlaps():
+    # Segments that share a graph node are the ones whose regions touch,
+    # which buildAdjacency finds from the geometry alone
+    app = Simulation(seed=0, mapData=generateCity(5, 10, 10, density=0.6))
+    segments = app.segments
+    byGrid = buildAdjacency(segments, buildRoadGrid(segments,
+                                                    app.roadWidth * 2))
+    for segment, found in zip(segments, byGrid):
+        expected = {id(other) for other in segments
+                    if other is not segment and overlaps(segment, other)}
+        assert {id(other) for other in segment.neighbors} == expected
+        assert {id(other) for other in found} == expected
+
+
+def testSegmentsAtMatchesScan():
+    app = Simulation(seed=0, mapData=generateCity(6, 10, 10, density=0.6))
+    player = app.player1
+    rng = random.Random(0)
+    for _ in range(500):
+        segment = rng.choice(app.segments)
+        player.segment, player.roadsVersion = segment, app.roadsVersion
+        if rng.random() < 0.8:
+            # A point on the tracked segment, or just off it
+            left, top, right, bottom = segment.bounds()
+            px = rng.uniform(left - 20, right + 20)
+            py = rng.uniform(top - 20, bottom + 20)
+        else:
+            px = rng.uniform(0, app.mapWidth)
+            py = rng.uniform(0, app.mapHeight)
+        found = {id(other) for other in player.segmentsAt(app, px, py)}
+        assert found == {id(other) for other in app.segments
+                         if other.isPlayerInRegion(px, py)}
+        assert player.isInRoadRegion(app, px, py) == \
+            any(road.isPlayerInRegion(px, py) for road in app.roads)